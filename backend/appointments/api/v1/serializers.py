@@ -1,10 +1,29 @@
+from django.conf import settings
 from rest_framework import serializers
 
 from appointments.models import Appointment
+from src.serializers import SparseFieldsetsMixin
 from users.api.v1.serializers import UserSerializer
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class StaffDurationMixin:
+    """Make ``duration`` writable only for doctors and staff.
+
+    Patients book and edit at the default length, so one request cannot hold
+    a doctor's whole day.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        user = getattr(self.context.get("request"), "user", None)
+        if "duration" in fields and not (
+            getattr(user, "is_doctor", False) or getattr(user, "is_staff", False)
+        ):
+            fields["duration"].read_only = True
+        return fields
+
+
+class AppointmentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source="patient.username", read_only=True)
     doctor_name = serializers.CharField(source="doctor.username", read_only=True)
 
@@ -15,16 +34,23 @@ class AppointmentSerializer(serializers.ModelSerializer):
             "patient_name",
             "doctor_name",
             "date",
+            "ends_at",
             "is_confirmed",
             "is_canceled",
         )
+        field_sources = {
+            "is_confirmed": ("status",),
+            "is_canceled": ("status",),
+        }
 
 
-class AppointmentDetailSerializer(serializers.ModelSerializer):
-    patient = UserSerializer(read_only=True)
-    doctor = UserSerializer(read_only=True)
-    status = serializers.ReadOnlyField()
-    
+class AppointmentDetailSerializer(
+    StaffDurationMixin, SparseFieldsetsMixin, serializers.ModelSerializer
+):
+    patient = serializers.PrimaryKeyRelatedField(read_only=True)
+    doctor = serializers.PrimaryKeyRelatedField(read_only=True)
+    status = serializers.CharField(source="get_status_display", read_only=True)
+
     class Meta:
         model = Appointment
         fields = (
@@ -32,17 +58,26 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
             "patient",
             "doctor",
             "date",
+            "duration",
+            "ends_at",
             "is_confirmed",
             "is_canceled",
             "created_at",
             "updated_at",
             "status",
         )
+        expandable_fields = {
+            "patient": (UserSerializer, {"read_only": True}),
+            "doctor": (UserSerializer, {"read_only": True}),
+        }
+        field_sources = {
+            "is_confirmed": ("status",),
+            "is_canceled": ("status",),
+            "status": ("status",),
+        }
 
 
-
-
-class AppointmentCreateSerializer(serializers.ModelSerializer):
+class AppointmentCreateSerializer(StaffDurationMixin, serializers.ModelSerializer):
     patient = serializers.PrimaryKeyRelatedField(
         queryset=UserSerializer.Meta.model.objects.all(), required=False
     )
@@ -53,4 +88,44 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Appointment
-        fields = ("id", "patient", "doctor", "date")
+        fields = ("id", "patient", "doctor", "date", "duration", "ends_at")
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    slot_minutes = serializers.IntegerField(
+        min_value=5, max_value=8 * 60, required=False
+    )
+    doctors = serializers.CharField(required=False)
+    after = serializers.IntegerField(min_value=0, required=False)
+
+    def validate_doctors(self, value):
+        try:
+            doctor_ids = sorted(
+                {int(item) for item in value.split(",") if item.strip()}
+            )
+        except ValueError:
+            raise serializers.ValidationError("Expected comma separated doctor IDs.")
+        if len(doctor_ids) > settings.AVAILABILITY_MAX_DOCTORS:
+            raise serializers.ValidationError(
+                f"At most {settings.AVAILABILITY_MAX_DOCTORS} doctors per request."
+            )
+        return doctor_ids
+
+    def validate(self, attrs):
+        if attrs["end"] < attrs["start"]:
+            raise serializers.ValidationError({"end": "Must not be before start."})
+        if (attrs["end"] - attrs["start"]).days >= settings.AVAILABILITY_MAX_DAYS:
+            raise serializers.ValidationError(
+                {"end": f"At most {settings.AVAILABILITY_MAX_DAYS} days per request."}
+            )
+        return attrs
+
+
+class AppointmentBulkActionSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.APPOINTMENT_BULK_MAX_IDS,
+    )
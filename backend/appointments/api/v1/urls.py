@@ -10,6 +10,26 @@ urlpatterns = [
         AppointmentViewSet.as_view({"get": "list", "post": "create"}),
         name="appointment-list",
     ),
+    path(
+        "appointments/availability/",
+        AppointmentViewSet.as_view({"get": "availability"}),
+        name="appointment-availability",
+    ),
+    path(
+        "appointments/export/",
+        AppointmentViewSet.as_view({"get": "export"}),
+        name="appointment-export",
+    ),
+    path(
+        "appointments/bulk-confirm/",
+        AppointmentViewSet.as_view({"post": "bulk_confirm"}),
+        name="appointment-bulk-confirm",
+    ),
+    path(
+        "appointments/bulk-cancel/",
+        AppointmentViewSet.as_view({"post": "bulk_cancel"}),
+        name="appointment-bulk-cancel",
+    ),
     path(
         "appointments/<int:pk>/",
         AppointmentViewSet.as_view(
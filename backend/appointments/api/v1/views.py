@@ -1,24 +1,72 @@
-from django.db.models import Case, When, Value, CharField
-from rest_framework import permissions, status, viewsets
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from rest_framework import exceptions, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from drf_yasg import openapi
 from drf_yasg.utils import no_body, swagger_auto_schema
 
+from appointments.availability import free_slots
 from appointments.models import Appointment
+from appointments.services import NOT_FOUND, transition_appointments
 from appointments.api.v1.serializers import (
+    AppointmentBulkActionSerializer,
     AppointmentCreateSerializer,
     AppointmentDetailSerializer,
     AppointmentSerializer,
+    AvailabilityQuerySerializer,
 )
+from src.export import export_response, iter_queryset
+from src.mixins import ConditionalGetMixin, SparseFieldsetsViewMixin
+from src.pagination import KeysetPagination
+from users.models import User
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The doctor already has an appointment at this time."
+    default_code = "appointment_conflict"
+
+
+BOOKING_CONSTRAINTS = {"appointment_no_overlap", "appointment_doctor_date_uniq"}
+# SQLite names no constraint in its errors, only the unique columns
+SQLITE_BOOKING_CONFLICT = (
+    "appointments_appointment.doctor_id, appointments_appointment.date"
+)
+
+
+def is_booking_conflict(error):
+    """Whether an IntegrityError comes from one of the booking constraints"""
+    diag = getattr(error.__cause__, "diag", None)
+    if diag is not None:
+        return diag.constraint_name in BOOKING_CONSTRAINTS
+    return SQLITE_BOOKING_CONFLICT in str(error)
+
+
+def parse_status(value):
+    """Return the status a ``?status=`` value names, by value or label"""
+    for status_value, label in Appointment.Status.choices:
+        if value.lower() in (status_value, label.lower()):
+            return status_value
+    raise exceptions.ValidationError(
+        {"status": [f"Expected one of: {', '.join(Appointment.Status.values)}."]}
+    )
+
+
+class AppointmentPagination(KeysetPagination):
+    ordering = ("date", "id")
+
+
+class AppointmentViewSet(
+    ConditionalGetMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet
+):
 
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
-    ordering = ["date"]
+    pagination_class = AppointmentPagination
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -29,8 +77,13 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return AppointmentCreateSerializer
         elif self.action in ["confirm", "cancel"]:
             return AppointmentDetailSerializer
+        elif self.action in ["bulk_confirm", "bulk_cancel"]:
+            return AppointmentBulkActionSerializer
         return AppointmentDetailSerializer
 
+    def get_version_stamps(self):
+        return [("appointments", self.request.user.id)]
+
     def get_queryset(self):
         user = self.request.user
 
@@ -38,23 +91,211 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             qs = Appointment.objects.filter(doctor=user)
         else:
             qs = Appointment.objects.filter(patient=user)
-        
-        qs = qs.select_related('patient', 'doctor') .annotate(
-            status=Case(
-                When(is_canceled=True, then=Value("Canceled")),
-                When(is_confirmed=True, then=Value("Confirmed")),
-                default=Value("Pending"),
-                output_field=CharField()
+
+        status_filter = self.request.query_params.get("status")
+        if self.action == "list" and status_filter is not None:
+            qs = qs.filter(status=parse_status(status_filter))
+        return qs
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "status",
+                openapi.IN_QUERY,
+                description="Only appointments in this status (value or label)",
+                type=openapi.TYPE_STRING,
+                enum=Appointment.Status.values,
+            ),
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="Cursor returned in 'next'/'previous'",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "page_size",
+                openapi.IN_QUERY,
+                description="Number of appointments per page",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @swagger_auto_schema(
+        operation_description=(
+            "List open appointment slots per doctor and working day between two "
+            "dates (inclusive). Slot times are local HH:MM strings. Doctors are "
+            "returned by ID, a page at a time; 'next' links to the following page."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "start",
+                openapi.IN_QUERY,
+                description="First day (YYYY-MM-DD)",
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                required=True,
+            ),
+            openapi.Parameter(
+                "end",
+                openapi.IN_QUERY,
+                description="Last day (YYYY-MM-DD)",
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                required=True,
+            ),
+            openapi.Parameter(
+                "slot_minutes",
+                openapi.IN_QUERY,
+                description="Slot length in minutes (defaults to the appointment length)",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "doctors",
+                openapi.IN_QUERY,
+                description="Comma separated doctor IDs (defaults to every doctor)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "after",
+                openapi.IN_QUERY,
+                description="Only doctors with a greater ID (set by 'next')",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+    )
+    @action(detail=False, methods=["get"])
+    def availability(self, request):
+        params = AvailabilityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        slot_minutes = params.validated_data.get(
+            "slot_minutes", settings.APPOINTMENT_DURATION_MINUTES
+        )
+
+        doctors = User.objects.filter(is_doctor=True)
+        if "doctors" in params.validated_data:
+            doctors = doctors.filter(id__in=params.validated_data["doctors"])
+        if "after" in params.validated_data:
+            doctors = doctors.filter(id__gt=params.validated_data["after"])
+        page_size = settings.AVAILABILITY_MAX_DOCTORS
+        doctor_ids = list(
+            doctors.order_by("id").values_list("id", flat=True)[: page_size + 1]
+        )
+        next_link = None
+        if len(doctor_ids) > page_size:
+            doctor_ids = doctor_ids[:page_size]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), "after", doctor_ids[-1]
             )
+
+        slots = free_slots(
+            doctor_ids,
+            params.validated_data["start"],
+            params.validated_data["end"],
+            slot_minutes,
         )
-        return qs
+        return Response(
+            {
+                "slot_minutes": slot_minutes,
+                "next": next_link,
+                "results": [
+                    {"doctor_id": doctor_id, "days": days}
+                    for doctor_id, days in slots.items()
+                ],
+            }
+        )
+
+    export_fields = (
+        "id",
+        "patient_id",
+        "patient",
+        "doctor_id",
+        "doctor",
+        "date",
+        "ends_at",
+        "status",
+        "created_at",
+        "updated_at",
+    )
+
+    @swagger_auto_schema(
+        operation_description="Stream every appointment of the current user, oldest first, as NDJSON or CSV.",
+        manual_parameters=[
+            openapi.Parameter(
+                "output",
+                openapi.IN_QUERY,
+                description="File format: ndjson (default) or csv",
+                type=openapi.TYPE_STRING,
+                enum=["ndjson", "csv"],
+            ),
+        ],
+    )
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        queryset = (
+            self.get_queryset()
+            .select_related("patient", "doctor")
+            .only(
+                "id",
+                "date",
+                "ends_at",
+                "status",
+                "created_at",
+                "updated_at",
+                "patient__username",
+                "doctor__username",
+            )
+            .order_by("date", "id")
+        )
+        rows = (
+            {
+                "id": appointment.id,
+                "patient_id": appointment.patient_id,
+                "patient": appointment.patient.username,
+                "doctor_id": appointment.doctor_id,
+                "doctor": appointment.doctor.username,
+                "date": appointment.date,
+                "ends_at": appointment.ends_at,
+                "status": appointment.get_status_display(),
+                "created_at": appointment.created_at,
+                "updated_at": appointment.updated_at,
+            }
+            for appointment in iter_queryset(queryset)
+        )
+        return export_response(request, rows, self.export_fields, "appointments")
+
+    @swagger_auto_schema(
+        responses={
+            201: AppointmentCreateSerializer,
+            409: "Conflict: The doctor already has an appointment at this time",
+        },
+    )
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def _save_booking(self, serializer, **kwargs):
+        # Overlapping bookings are rejected by the database constraints, so
+        # concurrent requests cannot both win; the savepoint keeps the
+        # surrounding transaction usable after the violation.
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError as e:
+            if is_booking_conflict(e):
+                raise AppointmentConflict()
+            raise
 
     def perform_create(self, serializer):
         user = self.request.user
         if user.is_doctor:
-            serializer.save(doctor=user, is_confirmed=False, is_canceled=False)
+            self._save_booking(serializer, doctor=user)
         else:
-            serializer.save(patient=user, is_confirmed=False, is_canceled=False)
+            self._save_booking(serializer, patient=user)
+
+    def perform_update(self, serializer):
+        self._save_booking(serializer)
 
     @swagger_auto_schema(
         operation_description="Confirm an appointment. This endpoint only requires the appointment ID in the URL path.",
@@ -80,28 +321,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         detail=True, methods=["post"], permission_classes=[permissions.IsAuthenticated]
     )
     def confirm(self, request, pk=None):
-        appointment = self.get_object()
-        if not (request.user.is_staff or appointment.doctor == request.user):
-            return Response(
-                {"detail": "You do not have permission to confirm this appointment."},
-                status=403,
-            )
-        if appointment.is_confirmed:
-            return Response(
-                {"detail": "This appointment is already confirmed."}, status=400
-            )
-        if appointment.is_canceled:
-            return Response(
-                {
-                    "detail": "This appointment has been canceled and cannot be confirmed."
-                },
-                status=400,
-            )
-
-        appointment.is_confirmed = True
-        appointment.save()
-        serializer = AppointmentDetailSerializer(appointment)
-        return Response(serializer.data)
+        return self._transition(request, pk, "confirm")
 
     @swagger_auto_schema(
         operation_description="Cancel an appointment. This endpoint only requires the appointment ID in the URL path.",
@@ -127,25 +347,79 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         detail=True, methods=["post"], permission_classes=[permissions.IsAuthenticated]
     )
     def cancel(self, request, pk=None):
-        appointment = self.get_object()
-        if not (request.user.is_staff or appointment.doctor == request.user):
+        return self._transition(request, pk, "cancel")
+
+    def _transition(self, request, pk, transition):
+        # One conditional UPDATE decides the outcome, so a concurrent confirm
+        # and cancel cannot both succeed; the row is only read afterwards.
+        if not (request.user.is_staff or request.user.is_doctor):
+            self.get_object()
             return Response(
-                {"detail": "You do not have permission to cancel this appointment."},
+                {
+                    "detail": f"You do not have permission to {transition} "
+                    "this appointment."
+                },
                 status=403,
             )
-        if appointment.is_canceled:
-            return Response(
-                {"detail": "This appointment is already canceled."}, status=400
-            )
-        if appointment.is_confirmed:
+        updated, failures = transition_appointments(
+            transition, [int(pk)], request.user
+        )
+        if not updated:
+            detail = failures[int(pk)]
+            if detail == NOT_FOUND:
+                raise Http404
+            return Response({"detail": detail}, status=400)
+        serializer = AppointmentDetailSerializer(self.get_object())
+        return Response(serializer.data)
+
+    def _bulk_transition(self, request, transition):
+        if not (request.user.is_staff or request.user.is_doctor):
             return Response(
-                {
-                    "detail": "This appointment has been confirmed and cannot be canceled."
-                },
-                status=400,
+                {"detail": f"You do not have permission to {transition} appointments."},
+                status=403,
             )
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated, failures = transition_appointments(
+            transition, serializer.validated_data["ids"], request.user
+        )
+        return Response(
+            {
+                "updated": updated,
+                "failed": [
+                    {"id": pk, "detail": detail} for pk, detail in failures.items()
+                ],
+            }
+        )
 
-        appointment.is_canceled = True
-        appointment.save()
-        serializer = AppointmentDetailSerializer(appointment)
-        return Response(serializer.data)
+    @swagger_auto_schema(
+        operation_description=(
+            "Confirm several pending appointments at once. IDs that cannot be "
+            "confirmed are listed under `failed` with the reason."
+        ),
+        request_body=AppointmentBulkActionSerializer,
+        responses={
+            200: "IDs of the confirmed appointments and per-ID failures",
+            403: "Forbidden: User doesn't have permission to confirm appointments",
+        },
+        operation_id="bulk_confirm_appointments",
+    )
+    @action(detail=False, methods=["post"], url_path="bulk-confirm")
+    def bulk_confirm(self, request):
+        return self._bulk_transition(request, "confirm")
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Cancel several pending appointments at once. IDs that cannot be "
+            "canceled are listed under `failed` with the reason."
+        ),
+        request_body=AppointmentBulkActionSerializer,
+        responses={
+            200: "IDs of the canceled appointments and per-ID failures",
+            403: "Forbidden: User doesn't have permission to cancel appointments",
+        },
+        operation_id="bulk_cancel_appointments",
+    )
+    @action(detail=False, methods=["post"], url_path="bulk-cancel")
+    def bulk_cancel(self, request):
+        return self._bulk_transition(request, "cancel")
@@ -0,0 +1,158 @@
+import bisect
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from appointments.models import Appointment
+from src.versioning import get_versions
+
+
+def _parse_time(value):
+    hours, minutes = value.split(":")
+    return datetime.time(int(hours), int(minutes))
+
+
+def workdays_between(first_day, last_day):
+    """Working days from ``first_day`` to ``last_day`` inclusive"""
+    return [
+        day
+        for day in (
+            first_day + datetime.timedelta(days=n)
+            for n in range((last_day - first_day).days + 1)
+        )
+        if day.weekday() in settings.APPOINTMENT_WORKDAYS
+    ]
+
+
+def _working_hours(day, tz):
+    start = _parse_time(settings.APPOINTMENT_WORKDAY_START)
+    end = _parse_time(settings.APPOINTMENT_WORKDAY_END)
+    return (
+        timezone.make_aware(datetime.datetime.combine(day, start), tz),
+        timezone.make_aware(datetime.datetime.combine(day, end), tz),
+    )
+
+
+def _booked_intervals(doctor_ids, window_start, window_end):
+    """Load every doctor's bookings overlapping the window with one range query.
+
+    Returns ``{doctor_id: (starts, ends)}`` as epoch seconds, sorted by start.
+    Active bookings of a doctor never overlap, so ``ends`` is sorted as well
+    and each day can be located with ``bisect``.
+    """
+    booked = {doctor_id: ([], []) for doctor_id in doctor_ids}
+    rows = (
+        Appointment.objects.filter(
+            doctor_id__in=doctor_ids,
+            date__lt=window_end,
+            ends_at__gt=window_start,
+        )
+        .exclude(status=Appointment.Status.CANCELED)
+        .order_by("doctor_id", "date")
+        .values_list("doctor_id", "date", "ends_at")
+    )
+    for doctor_id, start, end in rows:
+        starts, ends = booked[doctor_id]
+        starts.append(int(start.timestamp()))
+        ends.append(int(end.timestamp()))
+    return booked
+
+
+# "HH:MM" for every minute of the day, so slots are labelled without strftime
+_LABELS = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)]
+
+
+def _sweep(starts, ends, day_start, day_end, slot):
+    """Cut the gaps between bookings within one working day into slot labels.
+
+    Works on epoch seconds; ``day_start`` and ``day_end`` bound the working
+    hours and labels are counted from the start of the working day.
+    """
+    first_minute = _parse_time(settings.APPOINTMENT_WORKDAY_START)
+    first_minute = first_minute.hour * 60 + first_minute.minute
+    slots = []
+    cursor = day_start
+
+    for index in range(bisect.bisect_right(ends, day_start), len(starts)):
+        start, end = starts[index], ends[index]
+        if start >= day_end:
+            break
+        if end <= cursor:
+            continue
+        gap_end = min(start, day_end)
+        while cursor + slot <= gap_end:
+            slots.append(_LABELS[first_minute + (cursor - day_start) // 60])
+            cursor += slot
+        cursor = max(cursor, end)
+
+    while cursor + slot <= day_end:
+        slots.append(_LABELS[first_minute + (cursor - day_start) // 60])
+        cursor += slot
+    return slots
+
+
+def free_slots(doctor_ids, first_day, last_day, slot_minutes):
+    """Open appointment slots per doctor and working day.
+
+    Each doctor-day is cached under a key that embeds the doctor's
+    appointment version stamp, so any booking change invalidates it without
+    explicit deletes. Cache misses are computed together: one range query on
+    ``(doctor, date)`` loads the bookings of every missing doctor, and each
+    day is swept once over the sorted intervals.
+
+    Returns ``{doctor_id: {"YYYY-MM-DD": ["HH:MM", ...]}}`` in local time,
+    without days in the past or slots that have already started.
+    """
+    tz = timezone.get_current_timezone()
+    now = timezone.localtime(timezone.now(), tz)
+    days = workdays_between(max(first_day, now.date()), last_day)
+
+    versions = get_versions(*(("appointments", doctor_id) for doctor_id in doctor_ids))
+    keys = {
+        (doctor_id, day): (
+            f"slots:{doctor_id}:{day.isoformat()}:{slot_minutes}:{version}"
+        )
+        for doctor_id, version in zip(doctor_ids, versions)
+        for day in days
+    }
+    found = cache.get_many(keys.values())
+    slots = {
+        doctor_day: found[key] for doctor_day, key in keys.items() if key in found
+    }
+
+    missing = [doctor_day for doctor_day in keys if doctor_day not in slots]
+    if missing:
+        missing_days = sorted({day for _, day in missing})
+        booked = _booked_intervals(
+            sorted({doctor_id for doctor_id, _ in missing}),
+            _working_hours(missing_days[0], tz)[0],
+            _working_hours(missing_days[-1], tz)[1],
+        )
+        hours = {
+            day: tuple(int(bound.timestamp()) for bound in _working_hours(day, tz))
+            for day in missing_days
+        }
+        computed = {}
+        for doctor_id, day in missing:
+            starts, ends = booked[doctor_id]
+            computed[doctor_id, day] = _sweep(
+                starts, ends, *hours[day], slot_minutes * 60
+            )
+        cache.set_many(
+            {keys[doctor_day]: value for doctor_day, value in computed.items()},
+            timeout=settings.AVAILABILITY_CACHE_TTL,
+        )
+        slots.update(computed)
+
+    current = now.strftime("%H:%M")
+    result = {}
+    for doctor_id in doctor_ids:
+        result[doctor_id] = {}
+        for day in days:
+            day_slots = slots[doctor_id, day]
+            if day == now.date():
+                day_slots = [value for value in day_slots if value > current]
+            result[doctor_id][day.isoformat()] = day_slots
+    return result
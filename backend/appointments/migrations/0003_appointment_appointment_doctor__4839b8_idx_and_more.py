@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_remove_appointment_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'date', 'id'], name='appointment_doctor__4839b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'date', 'id'], name='appointment_patient_a74038_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_appointment_appointment_doctor__4839b8_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('is_canceled', False), ('is_confirmed', False)), fields=['date'], name='appointment_pending_date_idx'),
+        ),
+    ]
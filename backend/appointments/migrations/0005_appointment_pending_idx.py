@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_appointment_pending_date_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_pending_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('is_canceled', False), ('is_confirmed', False)), fields=['id', 'date'], name='appointment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:27
+
+import datetime
+
+import appointments.models
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_ends_at(apps, schema_editor):
+    Appointment = apps.get_model("appointments", "Appointment")
+    # Every existing row just received the default duration.
+    Appointment.objects.update(
+        ends_at=models.F("date")
+        + datetime.timedelta(minutes=settings.APPOINTMENT_DURATION_MINUTES)
+    )
+
+
+def check_overlaps(apps, schema_editor):
+    """Stop when active bookings of one doctor overlap.
+
+    The exclusion constraint added next would reject them, and which of two
+    real bookings to give up is not the migration's call. The conflicting IDs
+    are listed so they can be cancelled or moved before migrating again.
+    """
+    Appointment = apps.get_model("appointments", "Appointment")
+    rows = (
+        Appointment.objects.filter(is_canceled=False)
+        .order_by("doctor_id", "date", "id")
+        .values_list("id", "doctor_id", "date", "ends_at")
+    )
+    conflicts = []
+    current_doctor, busy_id, busy_until = None, None, None
+    for pk, doctor_id, date, ends_at in rows.iterator(chunk_size=2000):
+        if doctor_id != current_doctor:
+            current_doctor, busy_id, busy_until = doctor_id, None, None
+        if busy_until is not None and date < busy_until:
+            conflicts.append((doctor_id, busy_id, pk))
+        if busy_until is None or ends_at > busy_until:
+            busy_id, busy_until = pk, ends_at
+
+    if conflicts:
+        shown = 50
+        listed = "; ".join(
+            f"doctor {doctor_id}: {first} and {second}"
+            for doctor_id, first, second in conflicts[:shown]
+        )
+        if len(conflicts) > shown:
+            listed += f"; and {len(conflicts) - shown} more"
+        raise RuntimeError(
+            f"{len(conflicts)} active appointments overlap an earlier booking of "
+            f"the same doctor ({listed}). Cancel or move one appointment of each "
+            "pair, then run the migration again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointment_pending_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration',
+            field=models.PositiveSmallIntegerField(default=appointments.models.default_duration, help_text='Length in minutes', validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(480)]),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_ends_at, migrations.RunPython.noop),
+        migrations.RunPython(check_overlaps, migrations.RunPython.noop),
+    ]
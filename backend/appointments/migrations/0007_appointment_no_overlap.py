@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:27
+
+import appointments.models
+from django.db import migrations, models
+import src.constraints
+
+
+# Kept apart from 0006: PostgreSQL refuses to alter a table that still has
+# trigger events queued by the data fixes in the same transaction.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_time_range'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=src.constraints.PostgresExclusionConstraint(condition=models.Q(('is_canceled', False)), expressions=[(appointments.models.TsTzRange('date', 'ends_at'), '&&'), (appointments.models.Int8Range('doctor', 'doctor', models.Value('[]')), '=')], name='appointment_no_overlap'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_canceled', False)), fields=('doctor', 'date'), name='appointment_doctor_date_uniq'),
+        ),
+    ]
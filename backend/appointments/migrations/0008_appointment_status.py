@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:35
+
+import appointments.models
+from django.db import migrations, models
+import src.constraints
+
+
+def _check_constraints_now(schema_editor):
+    # PostgreSQL refuses to alter a table with trigger events still queued,
+    # so deferred foreign key checks run per statement during the copy.
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+def status_from_flags(apps, schema_editor):
+    _check_constraints_now(schema_editor)
+    Appointment = apps.get_model("appointments", "Appointment")
+    Appointment.objects.filter(is_canceled=True).update(status="canceled")
+    Appointment.objects.filter(is_confirmed=True, is_canceled=False).update(
+        status="confirmed"
+    )
+
+
+def flags_from_status(apps, schema_editor):
+    _check_constraints_now(schema_editor)
+    Appointment = apps.get_model("appointments", "Appointment")
+    Appointment.objects.filter(status="canceled").update(is_canceled=True)
+    Appointment.objects.filter(status="confirmed").update(is_confirmed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_appointment_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('canceled', 'Canceled')], default='pending', max_length=20),
+        ),
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='appointment_no_overlap',
+        ),
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='appointment_doctor_date_uniq',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_pending_idx',
+        ),
+        migrations.RunPython(status_from_flags, flags_from_status),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='is_canceled',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='is_confirmed',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'status', 'date', 'id'], name='appointment_doctor__6e5f05_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['id', 'date'], name='appointment_pending_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=src.constraints.PostgresExclusionConstraint(condition=models.Q(('status', 'canceled'), _negated=True), expressions=[(appointments.models.TsTzRange('date', 'ends_at'), '&&'), (appointments.models.Int8Range('doctor', 'doctor', models.Value('[]')), '=')], name='appointment_no_overlap'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'canceled'), _negated=True), fields=('doctor', 'date'), name='appointment_doctor_date_uniq'),
+        ),
+    ]
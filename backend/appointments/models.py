@@ -1,8 +1,37 @@
+import datetime
+
 from django.conf import settings
+from django.contrib.postgres.fields import (
+    BigIntegerRangeField,
+    DateTimeRangeField,
+    RangeOperators,
+)
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
+from src.constraints import PostgresExclusionConstraint
+
+
+def default_duration():
+    return settings.APPOINTMENT_DURATION_MINUTES
+
+
+class TsTzRange(models.Func):
+    function = "TSTZRANGE"
+    output_field = DateTimeRangeField()
+
+
+class Int8Range(models.Func):
+    function = "INT8RANGE"
+    output_field = BigIntegerRangeField()
+
 
 class Appointment(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        CONFIRMED = "confirmed", "Confirmed"
+        CANCELED = "canceled", "Canceled"
+
     patient = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -14,10 +43,71 @@ class Appointment(models.Model):
         related_name="appointment_as_doctor",
     )
     date = models.DateTimeField()
-    is_confirmed = models.BooleanField(default=False)
-    is_canceled = models.BooleanField(default=False)
+    duration = models.PositiveSmallIntegerField(
+        default=default_duration,
+        validators=[MinValueValidator(5), MaxValueValidator(8 * 60)],
+        help_text="Length in minutes",
+    )
+    ends_at = models.DateTimeField(editable=False)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["doctor", "date", "id"]),
+            models.Index(fields=["patient", "date", "id"]),
+            # A doctor's list filtered by status, in keyset order.
+            models.Index(fields=["doctor", "status", "date", "id"]),
+            # Serves the cancel_appointment sweep, which walks appointments
+            # still waiting for confirmation in primary key order.
+            models.Index(
+                fields=["id", "date"],
+                condition=models.Q(status="pending"),
+                name="appointment_pending_idx",
+            ),
+        ]
+        constraints = [
+            # A doctor cannot hold two active bookings whose [date, ends_at)
+            # ranges overlap. The GiST index answers the check in O(log n)
+            # and rejects concurrent inserts atomically. The doctor is
+            # compared as a one-value range so no btree_gist is needed.
+            PostgresExclusionConstraint(
+                name="appointment_no_overlap",
+                expressions=[
+                    (TsTzRange("date", "ends_at"), RangeOperators.OVERLAPS),
+                    (
+                        Int8Range("doctor", "doctor", models.Value("[]")),
+                        RangeOperators.EQUAL,
+                    ),
+                ],
+                condition=~models.Q(status="canceled"),
+            ),
+            # Same-start double bookings, also enforced on backends without
+            # exclusion constraints.
+            models.UniqueConstraint(
+                fields=["doctor", "date"],
+                condition=~models.Q(status="canceled"),
+                name="appointment_doctor_date_uniq",
+            ),
+        ]
+
+    @property
+    def is_confirmed(self):
+        return self.status == self.Status.CONFIRMED
+
+    @property
+    def is_canceled(self):
+        return self.status == self.Status.CANCELED
+
+    def save(self, *args, **kwargs):
+        self.ends_at = self.date + datetime.timedelta(minutes=self.duration)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"date", "duration"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "ends_at"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Appointment({self.patient.username} - {self.doctor.username} on {self.date})"
@@ -0,0 +1,70 @@
+from django.db import connection
+from django.utils import timezone
+
+from appointments.models import Appointment
+from src.versioning import bump_versions
+
+# Status set by each transition, and why an ID in another status was skipped
+TRANSITIONS = {
+    "confirm": (
+        Appointment.Status.CONFIRMED,
+        {
+            Appointment.Status.CONFIRMED: "This appointment is already confirmed.",
+            Appointment.Status.CANCELED: (
+                "This appointment has been canceled and cannot be confirmed."
+            ),
+        },
+    ),
+    "cancel": (
+        Appointment.Status.CANCELED,
+        {
+            Appointment.Status.CANCELED: "This appointment is already canceled.",
+            Appointment.Status.CONFIRMED: (
+                "This appointment has been confirmed and cannot be canceled."
+            ),
+        },
+    ),
+}
+
+NOT_FOUND = "Not found."
+
+
+def transition_appointments(transition, ids, user):
+    """Confirm or cancel the user's pending appointments among ``ids``.
+
+    The transition runs as one ``UPDATE ... WHERE id IN (...) AND <owner> =
+    user AND <pending>`` that returns the changed rows, so confirming a
+    whole day is a single round-trip. Only when some IDs did not change is
+    one more query made, reading the status of just those IDs to explain
+    each failure.
+
+    Returns ``(updated_ids, failures)`` with ``failures`` as ``{id: detail}``.
+    """
+    target, reasons = TRANSITIONS[transition]
+    owner = "doctor_id" if user.is_doctor else "patient_id"
+    ids = list(dict.fromkeys(ids))
+    qn = connection.ops.quote_name
+    table = qn(Appointment._meta.db_table)
+
+    # A single statement is atomic on its own; no transaction is opened.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {qn('status')} = %s, {qn('updated_at')} = %s "
+            f"WHERE {qn('id')} IN ({', '.join(['%s'] * len(ids))}) "
+            f"AND {qn(owner)} = %s AND {qn('status')} = %s "
+            f"RETURNING {qn('id')}, {qn('patient_id')}, {qn('doctor_id')}",
+            [target, timezone.now(), *ids, user.id, Appointment.Status.PENDING],
+        )
+        rows = cursor.fetchall()
+    bump_versions("appointments", *(user_id for _, *pair in rows for user_id in pair))
+
+    updated = {pk for pk, _, _ in rows}
+    failures = {pk: NOT_FOUND for pk in ids if pk not in updated}
+    if failures:
+        states = Appointment.objects.filter(
+            id__in=failures, **{owner: user.id}
+        ).values_list("id", "status")
+        for pk, status in states:
+            if status in reasons:
+                failures[pk] = reasons[status]
+    return [pk for pk in ids if pk in updated], failures
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appointments.models import Appointment
+from src.versioning import bump_versions
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def bump_appointment_versions(sender, instance, **kwargs):
+    bump_versions("appointments", instance.patient_id, instance.doctor_id)
@@ -1,15 +1,77 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 
 from celery import shared_task
 
+from src.versioning import bump_versions
+
 from .models import Appointment
 
+logger = logging.getLogger(__name__)
+
+SWEEP_WATERMARK_KEY = "appointments:sweep:watermark"
+
 
 @shared_task
-def cancel_appointment():
+def cancel_appointment(batch_size=None, max_batches=None):
+    """Cancel past appointments that were never confirmed, in small batches.
+
+    Expired rows are walked in primary key order, ``batch_size`` at a time,
+    and each batch is updated in its own short transaction, so row locks are
+    held for one batch however large the backlog is. A run stops after
+    ``max_batches``; the last processed id is kept in the cache as a
+    watermark and the next run resumes from it. Reaching the end of the table
+    resets the watermark so the following pass starts over.
+    """
+    batch_size = batch_size or settings.APPOINTMENT_SWEEP_BATCH_SIZE
+    max_batches = max_batches or settings.APPOINTMENT_SWEEP_MAX_BATCHES
+
+    started = time.monotonic()
     now = timezone.now()
-    expired_appointments = Appointment.objects.filter(
-        date__lt=now, is_confirmed=False, is_canceled=False
+    watermark = cache.get(SWEEP_WATERMARK_KEY, 0)
+    expired = Appointment.objects.filter(
+        date__lt=now, status=Appointment.Status.PENDING
+    )
+
+    canceled = batches = 0
+    while batches < max_batches:
+        ids = list(
+            expired.filter(pk__gt=watermark)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            watermark = 0
+            break
+
+        with transaction.atomic():
+            # Re-check the predicate: rows may have been confirmed meanwhile.
+            batch = expired.filter(pk__in=ids)
+            participants = set(batch.values_list("patient_id", "doctor_id"))
+            canceled += batch.update(
+                status=Appointment.Status.CANCELED, updated_at=timezone.now()
+            )
+            bump_versions(
+                "appointments", *(user_id for pair in participants for user_id in pair)
+            )
+
+        batches += 1
+        watermark = ids[-1]
+
+    cache.set(SWEEP_WATERMARK_KEY, watermark, timeout=None)
+    elapsed = time.monotonic() - started
+    logger.info(
+        "Canceled %d expired appointments in %d batches (%.2fs)",
+        canceled,
+        batches,
+        elapsed,
+    )
+    return (
+        f"Canceled {canceled} expired appointments in {batches} batches "
+        f"({elapsed:.2f}s)."
     )
-    count = expired_appointments.update(is_canceled=True)
-    return f"Canceled {count} expired appointments."
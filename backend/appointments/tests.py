@@ -1,9 +1,16 @@
-from django.contrib.auth.models import User
-from django.test import TestCase
+from types import SimpleNamespace
+
+import pytest
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from appointments.api.v1.views import is_booking_conflict
 from appointments.models import Appointment
-from appointments.tasks import cancel_appointment
+from appointments.tasks import SWEEP_WATERMARK_KEY, cancel_appointment
+from users.models import User
 
 
 @pytest.mark.django_db
@@ -21,9 +28,329 @@ def test_cancel_past_unconfirmed_appointments():
         doctor=doctor,
         patient=patient,
         date=timezone.now() - timezone.timedelta(days=1),
-        is_confirmed=False,
-        is_canceled=False,
+        status=Appointment.Status.PENDING,
     )
     cancel_appointment()
     appointment.refresh_from_db()
     assert appointment.is_canceled == True
+
+
+@pytest.mark.django_db
+def test_appointment_detail_expands_users_on_request(api_client, doctor, patient):
+    appointment = Appointment.objects.create(
+        doctor=doctor, patient=patient, date=timezone.now()
+    )
+    api_client.force_authenticate(patient)
+
+    compact = api_client.get(f"/api/v1/appointments/{appointment.id}/").json()
+    assert compact["doctor"] == doctor.id
+    assert compact["status"] == "Pending"
+
+    expanded = api_client.get(
+        f"/api/v1/appointments/{appointment.id}/?expand=doctor&fields=id,doctor"
+    ).json()
+    assert expanded == {
+        "id": appointment.id,
+        "doctor": {
+            "id": doctor.id,
+            "username": "doctor",
+            "email": "doc@example.com",
+            "is_doctor": True,
+        },
+    }
+
+    listed = api_client.get("/api/v1/appointments/?fields=id,doctor_name").json()
+    assert listed["results"] == [{"id": appointment.id, "doctor_name": "doctor"}]
+
+    with CaptureQueriesContext(connection) as queries:
+        full = api_client.get("/api/v1/appointments/").json()
+    assert full["results"][0]["is_confirmed"] is False
+    (select,) = [q["sql"] for q in queries if "appointments_appointment" in q["sql"]]
+    assert "created_at" not in select.split(" FROM ")[0]
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets_do_not_apply_to_writes(api_client, doctor, patient):
+    appointment = Appointment.objects.create(
+        doctor=doctor, patient=patient, date=timezone.now()
+    )
+    api_client.force_authenticate(doctor)
+
+    response = api_client.put(
+        f"/api/v1/appointments/{appointment.id}/?fields=id&expand=doctor",
+        {"date": appointment.date.isoformat(), "duration": 45},
+        format="json",
+    )
+
+    assert response.status_code == 200
+    assert response.json()["duration"] == 45
+    assert response.json()["doctor"] == doctor.id
+    appointment.refresh_from_db()
+    assert appointment.duration == 45
+
+
+@pytest.mark.django_db
+def test_appointments_export_as_csv(api_client, doctor, patient):
+    for days in (2, 1):
+        Appointment.objects.create(
+            patient=patient,
+            doctor=doctor,
+            date=timezone.now() + timezone.timedelta(days=days),
+        )
+    api_client.force_authenticate(patient)
+
+    response = api_client.get("/api/v1/appointments/export/?output=csv")
+    lines = b"".join(response.streaming_content).decode().splitlines()
+
+    assert response["Content-Disposition"] == 'attachment; filename="appointments.csv"'
+    assert lines[0] == (
+        "id,patient_id,patient,doctor_id,doctor,date,ends_at,status,created_at,updated_at"
+    )
+    assert len(lines) == 3
+    assert lines[1].split(",")[7] == "Pending"
+
+
+@pytest.mark.django_db
+def test_sweeper_works_in_batches_and_resumes(doctor, patient):
+    past = timezone.now() - timezone.timedelta(days=1)
+    expired = [
+        Appointment.objects.create(
+            patient=patient, doctor=doctor, date=past + timezone.timedelta(hours=n)
+        )
+        for n in range(5)
+    ]
+    confirmed = Appointment.objects.create(
+        patient=patient,
+        doctor=doctor,
+        date=past - timezone.timedelta(hours=1),
+        status=Appointment.Status.CONFIRMED,
+    )
+
+    first = cancel_appointment(batch_size=2, max_batches=2)
+    assert first.startswith("Canceled 4 expired appointments in 2 batches")
+    assert cache.get(SWEEP_WATERMARK_KEY) == expired[3].id
+
+    second = cancel_appointment(batch_size=2, max_batches=2)
+    assert second.startswith("Canceled 1 expired appointments in 1 batches")
+    assert cache.get(SWEEP_WATERMARK_KEY) == 0
+    assert Appointment.objects.filter(status=Appointment.Status.CANCELED).count() == 5
+    confirmed.refresh_from_db()
+    assert not confirmed.is_canceled
+
+
+@pytest.mark.django_db
+def test_availability_sweeps_gaps_and_caches_per_doctor_day(
+    api_client, doctor, patient, settings, django_capture_on_commit_callbacks
+):
+    settings.APPOINTMENT_WORKDAY_START = "08:00"
+    settings.APPOINTMENT_WORKDAY_END = "11:00"
+    today = timezone.localdate()
+    monday = today + timezone.timedelta(days=7 - today.weekday())
+
+    def at(hour, minute):
+        midnight = timezone.datetime.combine(monday, timezone.datetime.min.time())
+        return timezone.make_aware(midnight) + timezone.timedelta(
+            hours=hour, minutes=minute
+        )
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Appointment.objects.create(patient=patient, doctor=doctor, date=at(9, 0))
+        Appointment.objects.create(patient=patient, doctor=doctor, date=at(9, 30))
+        Appointment.objects.create(
+            patient=patient,
+            doctor=doctor,
+            date=at(10, 0),
+            status=Appointment.Status.CANCELED,
+        )
+    api_client.force_authenticate(patient)
+    url = f"/api/v1/appointments/availability/?start={monday}&end={monday}"
+
+    first = api_client.get(url).json()
+    with CaptureQueriesContext(connection) as queries:
+        cached = api_client.get(url).json()
+    with django_capture_on_commit_callbacks(execute=True):
+        Appointment.objects.create(patient=patient, doctor=doctor, date=at(8, 15))
+    changed = api_client.get(url).json()
+
+    day = monday.isoformat()
+    assert first["results"] == [
+        {"doctor_id": doctor.id, "days": {day: ["08:00", "08:30", "10:00", "10:30"]}}
+    ]
+    assert cached == first
+    assert not any("appointments_appointment" in q["sql"] for q in queries)
+    assert changed["results"][0]["days"][day] == ["10:00", "10:30"]
+
+
+@pytest.mark.django_db
+def test_availability_pages_through_doctors(api_client, doctor, patient, settings):
+    settings.AVAILABILITY_MAX_DOCTORS = 2
+    doctors = [doctor] + [
+        User.objects.create_user(username=f"doctor-{i}", password="!", is_doctor=True)
+        for i in range(2)
+    ]
+    today = timezone.localdate()
+    api_client.force_authenticate(patient)
+
+    url = f"/api/v1/appointments/availability/?start={today}&end={today}"
+    pages = []
+    while url:
+        page = api_client.get(url).json()
+        pages.append([result["doctor_id"] for result in page["results"]])
+        url = page["next"]
+
+    assert pages == [[doctors[0].id, doctors[1].id], [doctors[2].id]]
+
+
+@pytest.mark.django_db
+def test_overlapping_booking_is_rejected_with_conflict(api_client, doctor, patient):
+    start = timezone.now().replace(microsecond=0) + timezone.timedelta(days=1)
+    api_client.force_authenticate(doctor)
+
+    def book(at, **extra):
+        return api_client.post(
+            "/api/v1/appointments/",
+            {"patient": patient.id, "date": at.isoformat(), **extra},
+            format="json",
+        )
+
+    first = book(start, duration=45)
+    assert first.status_code == 201
+    assert parse_datetime(first.json()["ends_at"]) == start + timezone.timedelta(
+        minutes=45
+    )
+
+    clash = book(start)
+    assert clash.status_code == 409
+    assert clash.json()["detail"] == "The doctor already has an appointment at this time."
+    if connection.vendor == "postgresql":
+        assert book(start + timezone.timedelta(minutes=30)).status_code == 409
+    assert book(start + timezone.timedelta(minutes=45)).status_code == 201
+
+    Appointment.objects.filter(id=first.json()["id"]).update(
+        status=Appointment.Status.CANCELED
+    )
+    assert book(start).status_code == 201
+
+
+@pytest.mark.django_db
+def test_patients_book_at_the_default_duration(api_client, doctor, patient, settings):
+    start = timezone.now() + timezone.timedelta(days=1)
+    api_client.force_authenticate(patient)
+
+    response = api_client.post(
+        "/api/v1/appointments/",
+        {"doctor": doctor.id, "date": start.isoformat(), "duration": 480},
+        format="json",
+    )
+
+    assert response.status_code == 201
+    appointment = Appointment.objects.get(id=response.json()["id"])
+    assert appointment.duration == settings.APPOINTMENT_DURATION_MINUTES
+
+
+def test_booking_conflicts_are_recognised_by_constraint_name():
+    def integrity_error(message, constraint_name=None):
+        error = IntegrityError(message)
+        if constraint_name is not None:
+            # What psycopg2 attaches to the database error Django re-raises
+            error.__cause__ = Exception(message)
+            error.__cause__.diag = SimpleNamespace(constraint_name=constraint_name)
+        return error
+
+    assert is_booking_conflict(integrity_error("", "appointment_no_overlap"))
+    assert is_booking_conflict(integrity_error("", "appointment_doctor_date_uniq"))
+    assert not is_booking_conflict(
+        integrity_error("appointment_no_overlap", "appointments_patient_id_fk")
+    )
+    assert is_booking_conflict(
+        integrity_error(
+            "UNIQUE constraint failed: "
+            "appointments_appointment.doctor_id, appointments_appointment.date"
+        )
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_confirm_is_one_update_and_reports_failures(
+    api_client, doctor, patient, django_capture_on_commit_callbacks
+):
+    other = User.objects.create_user(
+        username="other", password="password", is_doctor=True
+    )
+    start = timezone.now() + timezone.timedelta(days=1)
+    pending = [
+        Appointment.objects.create(
+            patient=patient, doctor=doctor, date=start + timezone.timedelta(hours=n)
+        )
+        for n in range(3)
+    ]
+    canceled = Appointment.objects.create(
+        patient=patient, doctor=doctor, date=start, status=Appointment.Status.CANCELED
+    )
+    foreign = Appointment.objects.create(patient=patient, doctor=other, date=start)
+    api_client.force_authenticate(doctor)
+    ids = [appointment.id for appointment in pending]
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.post(
+            "/api/v1/appointments/bulk-confirm/", {"ids": ids}, format="json"
+        )
+    assert response.json() == {"updated": ids, "failed": []}
+    assert [q["sql"].split()[0] for q in queries] == ["UPDATE"]
+    assert (
+        Appointment.objects.filter(
+            id__in=ids, status=Appointment.Status.CONFIRMED
+        ).count()
+        == 3
+    )
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        response = api_client.post(
+            "/api/v1/appointments/bulk-cancel/",
+            {"ids": [ids[0], canceled.id, foreign.id, 999999]},
+            format="json",
+        )
+    assert response.json() == {
+        "updated": [],
+        "failed": [
+            {
+                "id": ids[0],
+                "detail": "This appointment has been confirmed and cannot be canceled.",
+            },
+            {"id": canceled.id, "detail": "This appointment is already canceled."},
+            {"id": foreign.id, "detail": "Not found."},
+            {"id": 999999, "detail": "Not found."},
+        ],
+    }
+    assert callbacks == []
+
+
+@pytest.mark.django_db
+def test_confirm_is_a_conditional_update_of_status_only(api_client, doctor, patient):
+    appointment = Appointment.objects.create(
+        patient=patient, doctor=doctor, date=timezone.now() + timezone.timedelta(days=1)
+    )
+    api_client.force_authenticate(doctor)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.post(f"/api/v1/appointments/{appointment.id}/confirm/")
+    assert response.status_code == 200
+    assert response.json()["status"] == "Confirmed"
+    updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+    assert len(updates) == 1
+    assert updates[0].split(" WHERE ")[0].count("=") == 2
+
+    response = api_client.post(f"/api/v1/appointments/{appointment.id}/cancel/")
+    assert response.status_code == 400
+    assert response.json() == {
+        "detail": "This appointment has been confirmed and cannot be canceled."
+    }
+    assert api_client.post("/api/v1/appointments/999999/cancel/").status_code == 404
+
+    confirmed = api_client.get("/api/v1/appointments/?status=confirmed").json()
+    pending = api_client.get("/api/v1/appointments/?status=pending").json()
+    assert [item["id"] for item in confirmed["results"]] == [appointment.id]
+    assert pending["results"] == []
+    by_label = api_client.get("/api/v1/appointments/?status=Confirmed").json()
+    assert by_label["results"] == confirmed["results"]
+    assert api_client.get("/api/v1/appointments/?status=done").status_code == 400
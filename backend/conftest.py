@@ -0,0 +1,47 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def medication_local_cache():
+    from medical_records.utils import cache_stats, local_cache
+
+    local_cache.clear()
+    cache_stats.reset()
+    yield
+    local_cache.clear()
+
+
+@pytest.fixture
+def doctor(db):
+    from users.models import User
+
+    return User.objects.create_user(
+        username="doctor", email="doc@example.com", password="password", is_doctor=True
+    )
+
+
+@pytest.fixture
+def patient(db):
+    from users.models import User
+
+    return User.objects.create_user(
+        username="patient", email="pat@example.com", password="password"
+    )
+
+
+@pytest.fixture
+def api_client():
+    from rest_framework.test import APIClient
+
+    return APIClient()
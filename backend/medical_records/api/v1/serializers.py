@@ -1,19 +1,19 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from medical_records.models import MedicalRecord, Medication
+from medical_records.models import MedicalRecord, Medication, MedicationPayload
+from src.serializers import SparseFieldsetsMixin
 from users.api.v1.serializers import UserSerializer
 
 User = get_user_model()
 
 
-class MedicationSerializer(serializers.ModelSerializer):
+class MedicationSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Medication
         fields = (
             "id",
             "name",
-            "external_data",
             "brand_name",
             "generic_name",
             "manufacturer",
@@ -22,14 +22,24 @@ class MedicationSerializer(serializers.ModelSerializer):
             "substance_name",
             "pharm_class",
             "known_reactions",
+            "reaction_counts",
+            "enrichment_pending",
         )
-        read_only_fields = ("external_data",)
+        read_only_fields = ("reaction_counts", "enrichment_pending")
 
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+class MedicationPayloadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MedicationPayload
+        fields = ("medication", "data", "updated_at")
+
+
+class MedicalRecordSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     patient_name = serializers.SerializerMethodField()
     doctor_name = serializers.SerializerMethodField()
-    medications = MedicationSerializer(many=True, read_only=True)
+    medications = serializers.SlugRelatedField(
+        many=True, read_only=True, slug_field="name"
+    )
 
     class Meta:
         model = MedicalRecord
@@ -43,6 +53,15 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
             "created_at",
             "medications",
         )
+        expandable_fields = {
+            "patient": (UserSerializer, {"read_only": True}),
+            "doctor": (UserSerializer, {"read_only": True}),
+            "medications": (MedicationSerializer, {"many": True, "read_only": True}),
+        }
+        field_sources = {
+            "patient_name": ("patient__username",),
+            "doctor_name": ("doctor__username",),
+        }
 
     def get_patient_name(self, obj):
         if obj.patient:
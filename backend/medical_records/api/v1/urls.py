@@ -1,7 +1,9 @@
 from django.urls import include, path
+from rest_framework.parsers import JSONParser
 from rest_framework.routers import DefaultRouter
 
-from medical_records.api.v1.views import MedicalRecordViewSet
+from medical_records.api.v1.views import MedicalRecordViewSet, MedicationViewSet
+from src.parsers import NDJSONParser
 
 router = DefaultRouter()
 urlpatterns = [
@@ -17,9 +19,31 @@ urlpatterns = [
         ),
         name="medical-record-detail",
     ),
+    path(
+        "medical-records/export/",
+        MedicalRecordViewSet.as_view({"get": "export"}),
+        name="medical-record-export",
+    ),
+    path(
+        "medical-records/bulk-import/",
+        MedicalRecordViewSet.as_view(
+            {"post": "bulk_import"}, parser_classes=[JSONParser, NDJSONParser]
+        ),
+        name="medical-record-bulk-import",
+    ),
     path(
         "medical-records/external-search/",
         MedicalRecordViewSet.as_view({"post": "external_search"}),
         name="external-search",
     ),
+    path(
+        "medications/search/",
+        MedicationViewSet.as_view({"get": "search"}),
+        name="medication-search",
+    ),
+    path(
+        "medications/<int:pk>/external-data/",
+        MedicationViewSet.as_view({"get": "external_data"}),
+        name="medication-external-data",
+    ),
 ]
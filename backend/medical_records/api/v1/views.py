@@ -1,26 +1,57 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import permissions, status, viewsets
+from rest_framework import exceptions, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from medical_records.api.v1.serializers import (
     MedicalRecordCreateSerializer,
     MedicalRecordSerializer,
+    MedicationPayloadSerializer,
     MedicationSerializer,
 )
-from medical_records.models import MedicalRecord, Medication
-from medical_records.utils import fetch_medication_data
+from medical_records.models import MedicalRecord, Medication, MedicationPayload
+from medical_records.services import (
+    import_medical_records,
+    resolve_medications,
+    search_medications,
+    set_record_medications,
+)
+from medical_records.tasks import enrich_medications
+from medical_records.utils import (
+    afetch_medication_data,
+    fetch_medication_data,
+    normalize_query,
+)
+from src.export import export_response, iter_queryset
+from src.mixins import ConditionalGetMixin, SparseFieldsetsViewMixin
+from src.pagination import KeysetPagination
 
 User = get_user_model()
 
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+class MedicalRecordPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
+
+
+class MedicalRecordViewSet(
+    ConditionalGetMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet
+):
     queryset = MedicalRecord.objects.all()
     serializer_class = MedicalRecordSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MedicalRecordPagination
 
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
@@ -34,7 +65,31 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
                 openapi.IN_QUERY,
                 description="ID do usuário para filtrar os registros (opcional)",
                 type=openapi.TYPE_INTEGER,
-            )
+            ),
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="Cursor da página retornado em 'next'/'previous'",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "page_size",
+                openapi.IN_QUERY,
+                description="Quantidade de registros por página",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "fields",
+                openapi.IN_QUERY,
+                description="Campos a retornar, separados por vírgula",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "expand",
+                openapi.IN_QUERY,
+                description="Relações a expandir: patient, doctor, medications",
+                type=openapi.TYPE_STRING,
+            ),
         ],
         operation_description="Lista os registros médicos filtrados pelo parâmetro 'user'.",
     )
@@ -59,6 +114,99 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         else:
             return MedicalRecord.objects.none()
 
+    export_fields = (
+        "id",
+        "patient_id",
+        "patient",
+        "doctor_id",
+        "doctor",
+        "description",
+        "medications",
+        "created_at",
+        "updated_at",
+    )
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Exporta o histórico de registros médicos em streaming (NDJSON ou CSV), "
+            "do mais antigo ao mais recente."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "patient",
+                openapi.IN_QUERY,
+                description="ID do paciente cujo histórico será exportado (opcional)",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "output",
+                openapi.IN_QUERY,
+                description="Formato do arquivo: ndjson (padrão) ou csv",
+                type=openapi.TYPE_STRING,
+                enum=["ndjson", "csv"],
+            ),
+        ],
+    )
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        queryset = self.get_queryset()
+        patient_param = request.query_params.get("patient")
+        if patient_param is not None:
+            try:
+                queryset = queryset.filter(patient_id=int(patient_param))
+            except ValueError:
+                return Response({"detail": "Invalid patient ID format"}, status=400)
+
+        queryset = (
+            queryset.select_related("patient", "doctor")
+            .only(
+                "id",
+                "description",
+                "created_at",
+                "updated_at",
+                "patient__username",
+                "doctor__username",
+            )
+            .prefetch_related(
+                Prefetch("medications", queryset=Medication.objects.only("id", "name"))
+            )
+            .order_by("created_at", "id")
+        )
+        rows = (
+            {
+                "id": record.id,
+                "patient_id": record.patient_id,
+                "patient": record.patient.username,
+                "doctor_id": record.doctor_id,
+                "doctor": record.doctor.username,
+                "description": record.description,
+                "medications": [
+                    medication.name for medication in record.medications.all()
+                ],
+                "created_at": record.created_at,
+                "updated_at": record.updated_at,
+            }
+            for record in iter_queryset(queryset)
+        )
+        return export_response(request, rows, self.export_fields, "medical-records")
+
+    def get_version_stamps(self):
+        # Mirrors get_queryset: doctors see every record, others one patient's.
+        user = self.request.user
+        if getattr(user, "is_doctor", False):
+            key = "all"
+        else:
+            try:
+                key = int(self.request.query_params.get("user", user.id))
+            except (ValueError, TypeError):
+                return None
+        return [("medical_records", key), ("medications", "all")]
+
+    def _schedule_enrichment(self, medication_ids):
+        """Enrich new medications from openFDA in the background, once committed"""
+        if medication_ids:
+            transaction.on_commit(lambda: enrich_medications.delay(medication_ids))
+
     @swagger_auto_schema(
         operation_description="Cria um registro médico. Apenas médicos podem criar registros.",
         responses={201: MedicalRecordSerializer()},
@@ -79,57 +227,83 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         except KeyError:
             return Response({"detail": "patient_id field is required."}, status=400)
 
-        medical_record = MedicalRecord.objects.create(
-            patient=patient,
-            doctor=user,
-            description=serializer.validated_data.get("description", ""),
-        )
+        with transaction.atomic():
+            medical_record = MedicalRecord.objects.create(
+                patient=patient,
+                doctor=user,
+                description=serializer.validated_data.get("description", ""),
+            )
+
+            medications, created_ids = resolve_medications(
+                serializer.validated_data.get("medications", [])
+            )
+            set_record_medications(medical_record, medications, is_new=True)
 
-        medications = serializer.validated_data.get("medications", [])
-        for med_name in medications:
-            medication, created = Medication.objects.get_or_create(name=med_name)
-
-            if created:
-                data, status_code, _ = fetch_medication_data(med_name)
-                if status_code == 200 and data:
-                    medication.external_data = data.get("raw_data")
-
-                    extracted = data.get("extracted_info", {})
-
-                    medication.brand_name = (
-                        next(iter(extracted.get("brand_names", [])), "") or None
-                    )
-                    medication.generic_name = (
-                        next(iter(extracted.get("generic_names", [])), "") or None
-                    )
-                    medication.manufacturer = (
-                        next(iter(extracted.get("manufacturers", [])), "") or None
-                    )
-                    medication.dosage_form = (
-                        next(iter(extracted.get("dosage_forms", [])), " ") or None
-                    )
-                    medication.route = (
-                        next(iter(extracted.get("routes", [])), "") or None
-                    )
-                    medication.substance_name = (
-                        next(iter(extracted.get("substance_names", [])), "") or None
-                    )
-                    medication.pharm_class = (
-                        next(iter(extracted.get("pharm_classes", [])), "") or None
-                    )
-
-                    medication.known_reactions = (
-                        ", ".join(extracted.get("reactions", [])) or None
-                    )
-
-                    medication.save()
-
-            medical_record.medications.add(medication)
+            self._schedule_enrichment(created_ids)
 
         return Response(
             MedicalRecordSerializer(medical_record).data, status=status.HTTP_201_CREATED
         )
 
+    @swagger_auto_schema(
+        method="post",
+        operation_description=(
+            "Importa registros médicos em lote (array JSON ou NDJSON). "
+            "Apenas médicos podem importar; itens inválidos são ignorados e "
+            "retornados em 'errors'."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "patient_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "description": openapi.Schema(type=openapi.TYPE_STRING),
+                    "medications": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(type=openapi.TYPE_STRING),
+                    ),
+                },
+                required=["patient_id", "description"],
+            ),
+        ),
+        responses={201: openapi.Response("Resumo da importação")},
+    )
+    @action(detail=False, methods=["post"], url_path="bulk-import")
+    def bulk_import(self, request):
+        user = self.request.user
+        if not hasattr(user, "is_doctor") or not user.is_doctor:
+            return Response(
+                {"detail": "You do not have permission to create a medical record."},
+                status=403,
+            )
+
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Expected a list of records."}, status=400)
+        if len(items) > settings.MEDICAL_RECORD_IMPORT_MAX_ITEMS:
+            return Response(
+                {
+                    "detail": "Too many records; send at most "
+                    f"{settings.MEDICAL_RECORD_IMPORT_MAX_ITEMS} per request."
+                },
+                status=400,
+            )
+
+        records, errors, created_ids = import_medical_records(
+            items, user, batch_size=settings.MEDICAL_RECORD_IMPORT_BATCH_SIZE
+        )
+        self._schedule_enrichment(created_ids)
+
+        return Response(
+            {
+                "created": len(records),
+                "ids": [record.id for record in records],
+                "errors": errors,
+            },
+            status=status.HTTP_201_CREATED if records else 400,
+        )
+
     @swagger_auto_schema(
         operation_description="Atualiza um registro médico. Apenas o médico responsável pode atualizar.",
         responses={200: MedicalRecordSerializer()},
@@ -154,57 +328,22 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
 
-        if "patient_id" in serializer.validated_data:
-            record.patient = serializer.validated_data["patient_id"]
-
-        if "description" in serializer.validated_data:
-            record.description = serializer.validated_data["description"]
-
-        record.save()
-
-        if "medications" in serializer.validated_data:
-            record.medications.clear()
-
-            medications = serializer.validated_data["medications"]
-            for med_name in medications:
-                medication, created = Medication.objects.get_or_create(name=med_name)
-
-                if created:
-                    data, status_code, _ = fetch_medication_data(med_name)
-                    if status_code == 200 and data:
-                        medication.external_data = data.get("raw_data")
-
-                        extracted = data.get("extracted_info", {})
-
-                        medication.brand_name = (
-                            next(iter(extracted.get("brand_names", [])), "") or None
-                        )
-                        medication.generic_name = (
-                            next(iter(extracted.get("generic_names", [])), "") or None
-                        )
-                        medication.manufacturer = (
-                            next(iter(extracted.get("manufacturers", [])), "") or None
-                        )
-                        medication.dosage_form = (
-                            next(iter(extracted.get("dosage_forms", [])), " ") or None
-                        )
-                        medication.route = (
-                            next(iter(extracted.get("routes", [])), "") or None
-                        )
-                        medication.substance_name = (
-                            next(iter(extracted.get("substance_names", [])), "") or None
-                        )
-                        medication.pharm_class = (
-                            next(iter(extracted.get("pharm_classes", [])), "") or None
-                        )
-
-                        medication.known_reactions = (
-                            ", ".join(extracted.get("reactions", [])) or None
-                        )
-
-                        medication.save()
-
-                record.medications.add(medication)
+        with transaction.atomic():
+            if "patient_id" in serializer.validated_data:
+                record.patient = serializer.validated_data["patient_id"]
+
+            if "description" in serializer.validated_data:
+                record.description = serializer.validated_data["description"]
+
+            record.save()
+
+            if "medications" in serializer.validated_data:
+                medications, created_ids = resolve_medications(
+                    serializer.validated_data["medications"]
+                )
+                set_record_medications(record, medications)
+
+                self._schedule_enrichment(created_ids)
 
         return Response(MedicalRecordSerializer(record).data)
 
@@ -246,7 +385,11 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         detail=False, methods=["post"], permission_classes=[permissions.IsAuthenticated]
     )
     def external_search(self, request):
-        """General search endpoint that doesn't require a specific record ID"""
+        """General search endpoint that doesn't require a specific record ID.
+
+        Served by the WSGI workers on the pooled sync client; the ASGI worker
+        routes the same path to the async ``external_search`` view instead.
+        """
         query = request.data.get("query")
         if not query:
             return Response({"detail": "Query parameter is required."}, status=400)
@@ -256,3 +399,122 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             return Response(data)
         else:
             return Response({"detail": message}, status=status_code)
+
+
+def _authenticate(request):
+    """Run the DRF authenticators on a plain Django request"""
+    return Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    ).user
+
+
+async def external_search(request):
+    """Realiza uma busca externa na API do FDA, filtrando pelo campo 'query'.
+
+    Async view, routed only by the ASGI worker (``src.asgi_urls``): a slow
+    openFDA response only parks this coroutine, so pending searches do not
+    hold worker threads. Under WSGI each request would get its own event loop
+    and async client, so WSGI keeps ``MedicalRecordViewSet.external_search``.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"detail": f'Method "{request.method}" not allowed.'}, status=405
+        )
+
+    try:
+        user = await sync_to_async(_authenticate)(request)
+    except exceptions.AuthenticationFailed as e:
+        return JsonResponse({"detail": e.detail}, status=401)
+    if not user.is_authenticated:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=401
+        )
+
+    if request.content_type == "application/json":
+        try:
+            body = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error."}, status=400)
+        query = body.get("query") if isinstance(body, dict) else None
+    else:
+        query = request.POST.get("query")
+    if not query:
+        return JsonResponse({"detail": "Query parameter is required."}, status=400)
+
+    data, status_code, message = await afetch_medication_data(query)
+    if status_code == 200:
+        return JsonResponse(data)
+    return JsonResponse({"detail": message}, status=status_code)
+
+
+# Token-authenticated API view; Django 4.2's csrf_exempt does not keep views async
+external_search.csrf_exempt = True
+
+
+class MedicationViewSet(viewsets.GenericViewSet):
+    queryset = Medication.objects.all()
+    serializer_class = MedicationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Busca medicamentos no catálogo local (prefixo e similaridade). "
+            "Consulta o openFDA apenas quando há poucos resultados locais."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "q",
+                openapi.IN_QUERY,
+                description="Termo de busca (mínimo de 2 caracteres)",
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Quantidade máxima de resultados",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        responses={200: openapi.Response("Medicamentos encontrados")},
+    )
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        query = normalize_query(request.query_params.get("q", ""))
+        if len(query) < 2:
+            return Response(
+                {"detail": "Query parameter 'q' must have at least 2 characters."},
+                status=400,
+            )
+
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 10
+        limit = max(1, min(limit, settings.MEDICATION_SEARCH_MAX_RESULTS))
+
+        medications = search_medications(query, limit)
+        response = {
+            "source": "local",
+            "results": MedicationSerializer(
+                medications, many=True, context=self.get_serializer_context()
+            ).data,
+        }
+
+        if len(medications) < min(limit, settings.MEDICATION_SEARCH_MIN_RESULTS):
+            data, status_code, _ = fetch_medication_data(query)
+            if status_code == 200 and data:
+                response["source"] = "openfda"
+                response["external"] = data.get("extracted_info")
+
+        return Response(response)
+
+    @swagger_auto_schema(
+        operation_description="Retorna o payload bruto do openFDA de um medicamento.",
+        responses={200: MedicationPayloadSerializer(), 404: "Not found"},
+    )
+    @action(detail=True, methods=["get"])
+    def external_data(self, request, pk=None):
+        payload = get_object_or_404(MedicationPayload, medication_id=pk)
+        return Response(MedicationPayloadSerializer(payload).data)
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """Small bounded in-process LRU cache with a per-entry time to live"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if self.max_size <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters kept per cache tier"""
+
+    def __init__(self, *tiers):
+        self._tiers = tiers
+        self._lock = threading.Lock()
+        self.reset()
+
+    def hit(self, tier):
+        with self._lock:
+            self._counters[tier]["hits"] += 1
+
+    def miss(self, tier):
+        with self._lock:
+            self._counters[tier]["misses"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {tier: dict(counters) for tier, counters in self._counters.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counters = {tier: {"hits": 0, "misses": 0} for tier in self._tiers}
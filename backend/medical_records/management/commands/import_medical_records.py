@@ -0,0 +1,88 @@
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from medical_records.services import import_medical_records
+from medical_records.tasks import enrich_medications
+from src.jsonstream import iter_json_array, iter_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import medical records from a JSON array (.json) or NDJSON "
+        "(.ndjson/.jsonl) file. Each chunk is validated and written with batched "
+        "inserts in its own transaction; invalid items are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File with the records to import")
+        parser.add_argument(
+            "--doctor",
+            type=int,
+            required=True,
+            help="ID of the doctor the records are attributed to",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of records written per transaction",
+        )
+        parser.add_argument(
+            "--no-enrich",
+            action="store_true",
+            help="Do not queue openFDA enrichment for new medications",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+
+        User = get_user_model()
+        try:
+            doctor = User.objects.get(id=options["doctor"], is_doctor=True)
+        except User.DoesNotExist:
+            raise CommandError(f"No doctor found with ID {options['doctor']}")
+
+        started = time.monotonic()
+        created = offset = 0
+        with path.open(encoding="utf-8") as fp:
+            if path.suffix in (".ndjson", ".jsonl"):
+                items = iter_ndjson(fp)
+            else:
+                items = iter_json_array(fp)
+
+            try:
+                while True:
+                    batch = list(islice(items, options["batch_size"]))
+                    if not batch:
+                        break
+
+                    records, errors, created_ids = import_medical_records(
+                        batch, doctor, batch_size=options["batch_size"]
+                    )
+                    if created_ids and not options["no_enrich"]:
+                        enrich_medications.delay(created_ids)
+
+                    for error in errors:
+                        self.stderr.write(
+                            f"Item {offset + error['index']}: "
+                            f"{json.dumps(error['errors'])}"
+                        )
+                    created += len(records)
+                    offset += len(batch)
+            except ValueError as e:
+                raise CommandError(f"Invalid input after {offset} items: {e}")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {created} of {offset} records in {elapsed:.1f}s "
+                f"({created / elapsed if elapsed else created:.0f} records/s)"
+            )
+        )
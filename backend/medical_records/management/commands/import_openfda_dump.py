@@ -0,0 +1,261 @@
+import io
+import time
+import zipfile
+from collections import Counter, defaultdict
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from medical_records.models import (
+    Medication,
+    OpenFDAImport,
+    OpenFDAImportReactions,
+    normalize_medication_name,
+)
+from medical_records.utils import (
+    ENRICHED_FIELDS,
+    MedicationInfoFolder,
+    apply_medication_data,
+)
+from src.jsonstream import iter_json_array
+from src.versioning import bump_versions
+
+
+class Command(BaseCommand):
+    help = (
+        "Import medications from downloaded openFDA drug event dumps (.json or "
+        ".json.zip). Files are stream-parsed, rows are upserted in batches and "
+        "progress is recorded with each batch so an interrupted import can be "
+        "resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Dump files to import")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Number of events folded into each upsert batch",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Discard recorded progress and import every file from the start",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total_events = total_medications = 0
+
+        for path in options["paths"]:
+            if not Path(path).exists():
+                raise CommandError(f"File not found: {path}")
+            # Progress is keyed on the resolved path so the same dump resumes
+            # however it is named on the command line.
+            path = str(Path(path).resolve())
+
+            for source, stream in self.open_dump(path):
+                if options["restart"]:
+                    self.discard_import(source)
+                progress, _ = OpenFDAImport.objects.get_or_create(source=source)
+                if progress.complete:
+                    self.stdout.write(f"Skipping {source}: already imported")
+                    continue
+                done = progress.events_imported
+                if done:
+                    self.stdout.write(f"Resuming {source} after {done} events")
+
+                results = islice(iter_json_array(stream, key="results"), done, None)
+                while True:
+                    batch = list(islice(results, options["batch_size"]))
+                    if not batch:
+                        break
+
+                    batch_started = time.monotonic()
+                    # The batch and the progress past it commit together, so
+                    # a rerun never folds the same events in twice.
+                    with transaction.atomic():
+                        upserted = self.upsert_batch(progress, batch)
+                        progress.events_imported += len(batch)
+                        progress.save(update_fields=["events_imported", "updated_at"])
+
+                    total_events += len(batch)
+                    total_medications += upserted
+                    elapsed = time.monotonic() - batch_started
+                    self.stdout.write(
+                        f"{source}: {progress.events_imported} events, {upserted} "
+                        f"medications upserted "
+                        f"({len(batch) / max(elapsed, 1e-6):.0f} events/s)"
+                    )
+
+                progress.complete = True
+                progress.save(update_fields=["complete", "updated_at"])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {total_events} events and upserted {total_medications} "
+                f"medications in {elapsed:.1f}s "
+                f"({total_events / max(elapsed, 1e-6):.0f} events/s)"
+            )
+        )
+
+    def open_dump(self, path):
+        """Yield ``(source, text stream)`` for a dump file or each JSON file in a zip"""
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.namelist():
+                    if member.endswith(".json"):
+                        with archive.open(member) as raw:
+                            yield f"{path}:{member}", io.TextIOWrapper(
+                                raw, encoding="utf-8"
+                            )
+        else:
+            with open(path, encoding="utf-8") as stream:
+                yield path, stream
+
+    def discard_import(self, source):
+        """Forget a source's progress and take its reactions back out of the counts"""
+        with transaction.atomic():
+            medication_ids = list(
+                OpenFDAImportReactions.objects.filter(
+                    source__source=source
+                ).values_list("medication_id", flat=True)
+            )
+            OpenFDAImport.objects.filter(source=source).delete()
+            medications = list(Medication.objects.filter(id__in=medication_ids))
+            self.rebuild_reactions(medications)
+            Medication.objects.bulk_update(
+                medications,
+                fields=["known_reactions", "reaction_counts"],
+                batch_size=1000,
+            )
+
+    def upsert_batch(self, progress, events):
+        """Fold a batch of events per drug name and upsert the medications"""
+        folders = defaultdict(MedicationInfoFolder)
+        names = {}
+        for event in events:
+            patient = event.get("patient", {})
+            for drug in patient.get("drug", []):
+                name = (drug.get("medicinalproduct") or "").strip()
+                if name:
+                    key = normalize_medication_name(name)
+                    names.setdefault(key, name)
+                    folders[key].add(
+                        [
+                            {
+                                "patient": {
+                                    "reaction": patient.get("reaction", []),
+                                    "drug": [drug],
+                                }
+                            }
+                        ]
+                    )
+
+        if not folders:
+            return 0
+
+        imported = {}
+        for key, folder in folders.items():
+            imported[key] = apply_medication_data(
+                Medication(name=names[key], normalized_name=key),
+                {"extracted_info": folder.extracted()},
+            )
+            imported[key].enrichment_pending = False
+
+        existing = set(
+            Medication.objects.filter(normalized_name__in=folders).values_list(
+                "normalized_name", flat=True
+            )
+        )
+        Medication.objects.bulk_create(
+            [imported[key] for key in folders if key not in existing],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+        medications = list(Medication.objects.filter(normalized_name__in=folders))
+        for medication in medications:
+            if medication.normalized_name in existing:
+                source = imported[medication.normalized_name]
+                for field in ENRICHED_FIELDS:
+                    if field in ("known_reactions", "reaction_counts"):
+                        continue
+                    if not getattr(medication, field):
+                        setattr(medication, field, getattr(source, field))
+                medication.enrichment_pending = False
+
+        self.add_reactions(
+            progress,
+            {
+                medication.id: folders[medication.normalized_name].counts["reactions"]
+                for medication in medications
+            },
+        )
+        self.rebuild_reactions(medications)
+        Medication.objects.bulk_update(
+            medications,
+            fields=[*ENRICHED_FIELDS, "enrichment_pending"],
+            batch_size=1000,
+        )
+        if existing:
+            bump_versions("medications", "all")
+        return len(medications)
+
+    def add_reactions(self, progress, counts_by_id):
+        """Add a batch's reaction counts to what ``progress`` contributed so far"""
+        stored = {
+            row.medication_id: row
+            for row in OpenFDAImportReactions.objects.filter(
+                source=progress, medication_id__in=counts_by_id
+            )
+        }
+        to_create, to_update = [], []
+        for medication_id, counts in counts_by_id.items():
+            row = stored.get(medication_id)
+            if row is None:
+                to_create.append(
+                    OpenFDAImportReactions(
+                        source=progress,
+                        medication_id=medication_id,
+                        counts=dict(counts),
+                    )
+                )
+            else:
+                row.counts = dict(Counter(row.counts) + counts)
+                to_update.append(row)
+        OpenFDAImportReactions.objects.bulk_create(to_create, batch_size=1000)
+        OpenFDAImportReactions.objects.bulk_update(
+            to_update, fields=["counts"], batch_size=1000
+        )
+
+    def rebuild_reactions(self, medications):
+        """Recompute the top reactions of ``medications`` from every imported source.
+
+        A drug's events are spread over many batches and files, so its top
+        reactions are the sum over all of them. Each source's share is stored
+        separately and the total is rebuilt rather than added to, so resuming
+        or restarting an import never counts the same events twice. The totals
+        replace counts sampled by the API lookup; rows with reactions but no
+        counts were entered by hand and are left as-is.
+        """
+        totals = defaultdict(Counter)
+        for medication_id, counts in OpenFDAImportReactions.objects.filter(
+            medication__in=medications
+        ).values_list("medication_id", "counts"):
+            totals[medication_id].update(counts)
+
+        for medication in medications:
+            if medication.known_reactions and not medication.reaction_counts:
+                continue
+            top = totals[medication.id].most_common(settings.OPENFDA_TOP_REACTIONS)
+            medication.reaction_counts = [
+                [reaction, count] for reaction, count in top
+            ] or None
+            medication.known_reactions = (
+                ", ".join(reaction for reaction, _ in top) or None
+            )
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+def mark_enriched_medications(apps, schema_editor):
+    Medication = apps.get_model('medical_records', 'Medication')
+    Medication.objects.filter(external_data__isnull=False).update(enrichment_pending=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0003_medication_brand_name_medication_dosage_form_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='enrichment_pending',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(mark_enriched_medications, migrations.RunPython.noop),
+    ]
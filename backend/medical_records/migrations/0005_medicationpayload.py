@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_external_data(apps, schema_editor):
+    Medication = apps.get_model('medical_records', 'Medication')
+    MedicationPayload = apps.get_model('medical_records', 'MedicationPayload')
+
+    rows = (
+        Medication.objects.filter(external_data__isnull=False)
+        .values_list('id', 'external_data')
+        .iterator(chunk_size=500)
+    )
+    batch = []
+    for medication_id, data in rows:
+        batch.append(MedicationPayload(medication_id=medication_id, data=data))
+        if len(batch) >= 500:
+            MedicationPayload.objects.bulk_create(batch)
+            batch = []
+    MedicationPayload.objects.bulk_create(batch)
+
+
+def restore_external_data(apps, schema_editor):
+    Medication = apps.get_model('medical_records', 'Medication')
+    MedicationPayload = apps.get_model('medical_records', 'MedicationPayload')
+
+    for payload in MedicationPayload.objects.iterator(chunk_size=500):
+        Medication.objects.filter(id=payload.medication_id).update(external_data=payload.data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0004_medication_enrichment_pending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicationPayload',
+            fields=[
+                ('medication', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='medical_records.medication')),
+                ('data', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(move_external_data, restore_external_data),
+        migrations.RemoveField(
+            model_name='medication',
+            name='external_data',
+        ),
+    ]
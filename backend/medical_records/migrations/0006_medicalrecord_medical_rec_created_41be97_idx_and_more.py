@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0005_medicationpayload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['created_at', 'id'], name='medical_rec_created_41be97_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', 'created_at', 'id'], name='medical_rec_patient_2b8524_idx'),
+        ),
+    ]
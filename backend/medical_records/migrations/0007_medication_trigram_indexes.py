@@ -0,0 +1,30 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import src.indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0006_medicalrecord_medical_rec_created_41be97_idx_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='medication',
+            index=src.indexes.PostgresGinIndex(fields=['name'], name='medication_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=src.indexes.PostgresGinIndex(fields=['brand_name'], name='medication_brand_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=src.indexes.PostgresGinIndex(fields=['generic_name'], name='medication_generic_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=src.indexes.PostgresGinIndex(fields=['substance_name'], name='medication_substance_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
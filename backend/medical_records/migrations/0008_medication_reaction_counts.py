@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0007_medication_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='reaction_counts',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
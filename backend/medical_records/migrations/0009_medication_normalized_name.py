@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+def set_canonical_names(apps, schema_editor):
+    """Key the oldest row of each normalized name; later duplicates stay NULL"""
+    Medication = apps.get_model('medical_records', 'Medication')
+    seen = set()
+    batch = []
+    for medication in Medication.objects.only('id', 'name').order_by('id').iterator(chunk_size=2000):
+        key = ' '.join(medication.name.split()).lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        medication.normalized_name = key
+        batch.append(medication)
+        if len(batch) >= 2000:
+            Medication.objects.bulk_update(batch, ['normalized_name'])
+            batch = []
+    Medication.objects.bulk_update(batch, ['normalized_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0008_medication_reaction_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='normalized_name',
+            field=models.CharField(editable=False, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(set_canonical_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0009_medication_normalized_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenFDAImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=1024, unique=True)),
+                ('events_imported', models.PositiveIntegerField(default=0)),
+                ('complete', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OpenFDAImportReactions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counts', models.JSONField(default=dict)),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imported_reactions', to='medical_records.medication')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='medical_records.openfdaimport')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='openfdaimportreactions',
+            constraint=models.UniqueConstraint(fields=('source', 'medication'), name='openfda_import_reactions_uniq'),
+        ),
+    ]
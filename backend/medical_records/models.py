@@ -1,10 +1,21 @@
 from django.conf import settings
 from django.db import models
 
+from src.indexes import PostgresGinIndex
+
+
+def normalize_medication_name(name):
+    """Canonical identity of a medication name: trimmed, single-spaced, lowercase"""
+    return " ".join(name.split()).lower()
+
 
 class Medication(models.Model):
     name = models.CharField(max_length=255)
-    external_data = models.JSONField(blank=True, null=True)
+    # Unique lookup key for ``name``. NULL only on legacy duplicates waiting
+    # for ``merge_duplicate_medications`` to fold them into the canonical row.
+    normalized_name = models.CharField(
+        max_length=255, unique=True, null=True, editable=False
+    )
 
     brand_name = models.CharField(max_length=255, blank=True, null=True)
     generic_name = models.CharField(max_length=255, blank=True, null=True)
@@ -14,11 +25,99 @@ class Medication(models.Model):
     substance_name = models.CharField(max_length=255, blank=True, null=True)
     pharm_class = models.CharField(max_length=255, blank=True, null=True)
     known_reactions = models.TextField(blank=True, null=True)
+    reaction_counts = models.JSONField(blank=True, null=True)
+    enrichment_pending = models.BooleanField(default=True)
+
+    class Meta:
+        # Trigram indexes serving the fuzzy filter of the local medication
+        # search (``services.search_medications``).
+        indexes = [
+            PostgresGinIndex(
+                fields=[column],
+                opclasses=["gin_trgm_ops"],
+                name=f"medication_{column}_trgm",
+            )
+            for column in ("name", "brand_name", "generic_name", "substance_name")
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so save() can tell a rename from an unrelated update
+        instance._loaded_name = instance.__dict__.get("name")
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if self._state.adding:
+            if self.normalized_name is None:
+                self.normalized_name = normalize_medication_name(self.name)
+        elif (
+            "name" in self.__dict__
+            and self.name != getattr(self, "_loaded_name", None)
+            and (update_fields is None or "name" in update_fields)
+        ):
+            self.normalized_name = normalize_medication_name(self.name)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "normalized_name"}
+        super().save(*args, **kwargs)
+        self._loaded_name = self.__dict__.get("name")
 
     def __str__(self):
         return self.name
 
 
+class MedicationPayload(models.Model):
+    """Raw openFDA response for a medication, kept out of the hot Medication row"""
+
+    medication = models.OneToOneField(
+        "Medication",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="payload",
+    )
+    data = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"MedicationPayload({self.medication_id})"
+
+
+class OpenFDAImport(models.Model):
+    """Progress of ``import_openfda_dump`` through one dump file or zip member"""
+
+    source = models.CharField(max_length=1024, unique=True)
+    events_imported = models.PositiveIntegerField(default=0)
+    complete = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"OpenFDAImport({self.source})"
+
+
+class OpenFDAImportReactions(models.Model):
+    """Reaction counts one imported dump source contributed to a medication"""
+
+    source = models.ForeignKey(
+        "OpenFDAImport", on_delete=models.CASCADE, related_name="reactions"
+    )
+    medication = models.ForeignKey(
+        "Medication", on_delete=models.CASCADE, related_name="imported_reactions"
+    )
+    counts = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "medication"],
+                name="openfda_import_reactions_uniq",
+            )
+        ]
+
+    def __str__(self):
+        return f"OpenFDAImportReactions({self.source_id}, {self.medication_id})"
+
+
 class MedicalRecord(models.Model):
     patient = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -37,5 +136,11 @@ class MedicalRecord(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["patient", "created_at", "id"]),
+        ]
+
     def __str__(self):
         return f"MedicalRecord({self.patient.username} - {self.doctor.username} on {self.created_at})"
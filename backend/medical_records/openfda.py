@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Sent with ``name``, ``previous`` and ``state`` whenever a breaker changes state
+breaker_state_changed = Signal()
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling upstream while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker whose state is shared through the Django cache.
+
+    Calls and failures are counted in fixed windows. Once a window holds at
+    least ``OPENFDA_BREAKER_MIN_CALLS`` calls and the failure rate reaches
+    ``OPENFDA_BREAKER_FAILURE_RATE``, the breaker opens and every worker fails
+    fast for ``OPENFDA_BREAKER_OPEN_SECONDS``. After that a single probe request
+    is let through: success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name):
+        self.name = name
+        self.state_key = f"breaker:{name}:state"
+        self.probe_key = f"breaker:{name}:probe"
+
+    def state(self):
+        opened = cache.get(self.state_key)
+        if opened is None:
+            return self.CLOSED
+        if time.time() < opened["retry_at"]:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow_request(self):
+        state = self.state()
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        return cache.add(
+            self.probe_key, 1, timeout=settings.OPENFDA_BREAKER_OPEN_SECONDS
+        )
+
+    def record_success(self):
+        state = self.state()
+        if state == self.CLOSED:
+            self._count(failed=False)
+        elif state == self.HALF_OPEN:
+            cache.delete_many([self.state_key, self.probe_key])
+            self._changed(state, self.CLOSED)
+
+    def record_failure(self):
+        state = self.state()
+        if state == self.HALF_OPEN:
+            self._open(state)
+        elif state == self.CLOSED:
+            calls, failures = self._count(failed=True)
+            if (
+                calls >= settings.OPENFDA_BREAKER_MIN_CALLS
+                and failures / calls >= settings.OPENFDA_BREAKER_FAILURE_RATE
+            ):
+                self._open(state)
+
+    def _window_keys(self):
+        window = int(time.time() // settings.OPENFDA_BREAKER_WINDOW)
+        return (
+            f"breaker:{self.name}:calls:{window}",
+            f"breaker:{self.name}:failures:{window}",
+        )
+
+    def _count(self, failed):
+        calls_key, failures_key = self._window_keys()
+        timeout = settings.OPENFDA_BREAKER_WINDOW * 2
+        try:
+            cache.add(calls_key, 0, timeout=timeout)
+            calls = cache.incr(calls_key)
+            if failed:
+                cache.add(failures_key, 0, timeout=timeout)
+                failures = cache.incr(failures_key)
+            else:
+                failures = cache.get(failures_key, 0)
+        except ValueError:
+            # The window rolled over between add and incr; start counting again.
+            return 0, 0
+        return calls, failures
+
+    def _open(self, previous):
+        cache.set(
+            self.state_key,
+            {"retry_at": time.time() + settings.OPENFDA_BREAKER_OPEN_SECONDS},
+            timeout=None,
+        )
+        cache.delete_many([self.probe_key, *self._window_keys()])
+        self._changed(previous, self.OPEN)
+
+    def _changed(self, previous, state):
+        logger.warning(
+            "Circuit breaker %s changed from %s to %s", self.name, previous, state
+        )
+        breaker_state_changed.send(
+            sender=self.__class__, name=self.name, previous=previous, state=state
+        )
+
+
+breaker = CircuitBreaker("openfda")
+
+
+class OpenFDAClient:
+    """HTTP client for the openFDA API backed by a pooled keep-alive session.
+
+    Every request has connect/read timeouts, and idempotent GETs are retried
+    with jittered exponential backoff on connection errors, 429 and 5xx
+    responses (honouring ``Retry-After``).
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        timeout=None,
+        max_retries=None,
+        backoff_factor=None,
+        pool_size=None,
+        circuit_breaker=None,
+    ):
+        self.breaker = circuit_breaker or breaker
+        self.base_url = (base_url or settings.OPENFDA_BASE_URL).rstrip("/")
+        self.timeout = timeout or (
+            settings.OPENFDA_CONNECT_TIMEOUT,
+            settings.OPENFDA_READ_TIMEOUT,
+        )
+
+        retry = Retry(
+            total=settings.OPENFDA_MAX_RETRIES if max_retries is None else max_retries,
+            backoff_factor=(
+                settings.OPENFDA_BACKOFF_FACTOR
+                if backoff_factor is None
+                else backoff_factor
+            ),
+            backoff_jitter=settings.OPENFDA_BACKOFF_JITTER,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size or settings.OPENFDA_POOL_SIZE,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, params=None):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError("openFDA is temporarily unavailable")
+
+        try:
+            response = self.session.get(
+                f"{self.base_url}/{path.lstrip('/')}",
+                params=params,
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        response.raise_for_status()
+        return response.json()
+
+    def drug_events(self, query, limit=5, skip=0):
+        params = {"search": f"patient.drug.medicinalproduct:{query}", "limit": limit}
+        if skip:
+            params["skip"] = skip
+        return self.get("drug/event.json", params=params)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOpenFDAClient:
+    """Non-blocking counterpart of ``OpenFDAClient`` for async views.
+
+    One ``httpx.AsyncClient`` keeps a bounded keep-alive pool per event loop,
+    so hundreds of pending lookups share ``OPENFDA_ASYNC_POOL_SIZE``
+    connections while the loop keeps serving other requests. Retries, backoff
+    and the shared circuit breaker behave as in the sync client; breaker calls
+    touch the cache and run in a worker thread.
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        max_retries=None,
+        pool_size=None,
+        circuit_breaker=None,
+        transport=None,
+    ):
+        self.breaker = circuit_breaker or breaker
+        self.max_retries = (
+            settings.OPENFDA_MAX_RETRIES if max_retries is None else max_retries
+        )
+        pool_size = pool_size or settings.OPENFDA_ASYNC_POOL_SIZE
+        self.client = httpx.AsyncClient(
+            base_url=(base_url or settings.OPENFDA_BASE_URL).rstrip("/"),
+            timeout=httpx.Timeout(
+                settings.OPENFDA_READ_TIMEOUT, connect=settings.OPENFDA_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            transport=transport,
+        )
+
+    async def get(self, path, params=None):
+        if not await sync_to_async(self.breaker.allow_request)():
+            raise CircuitOpenError("openFDA is temporarily unavailable")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.get(f"/{path.lstrip('/')}", params=params)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    await sync_to_async(self.breaker.record_failure)()
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            await asyncio.sleep(self._backoff(attempt, response))
+
+        if response.status_code in RETRY_STATUSES:
+            await sync_to_async(self.breaker.record_failure)()
+        else:
+            await sync_to_async(self.breaker.record_success)()
+
+        response.raise_for_status()
+        return response.json()
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response else None
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        return settings.OPENFDA_BACKOFF_FACTOR * (2**attempt) + random.uniform(
+            0, settings.OPENFDA_BACKOFF_JITTER
+        )
+
+    async def drug_events(self, query, limit=5, skip=0):
+        params = {"search": f"patient.drug.medicinalproduct:{query}", "limit": limit}
+        if skip:
+            params["skip"] = skip
+        return await self.get("drug/event.json", params=params)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Return the client bound to the running event loop.
+
+    httpx pools cannot be shared across loops, so each loop gets its own.
+    Only the ASGI worker calls this, where there is one loop per process;
+    ``aclose_async_client`` closes it on lifespan shutdown.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOpenFDAClient()
+    return client
+
+
+async def aclose_async_client():
+    """Close the running loop's client, if one was created"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client, creating a fresh one after a fork"""
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = OpenFDAClient()
+                _client_pid = pid
+    return _client
+
+
+def reset_client():
+    """Drop the process-wide client so the next call picks up new settings"""
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
@@ -0,0 +1,289 @@
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from medical_records.models import (
+    MedicalRecord,
+    Medication,
+    normalize_medication_name,
+)
+from src.versioning import bump_versions
+
+SEARCH_FIELDS = ("name", "brand_name", "generic_name", "substance_name")
+
+
+def resolve_medications(names):
+    """Map medication names to Medication rows through the normalized key.
+
+    Names that differ only in case or spacing resolve to the same row.
+    Existing rows are loaded with one query on the unique ``normalized_name``
+    index; missing ones are inserted with one ``INSERT ... ON CONFLICT DO
+    NOTHING``, so concurrent requests creating the same drug cannot produce
+    duplicates, and are then read back. Returns the medications in the order
+    the names were given (duplicates removed) and the ids of the rows this
+    call inserted, leaving out any a concurrent request inserted first.
+    """
+    names_by_key = {}
+    for name in names:
+        if name and name.strip():
+            names_by_key.setdefault(normalize_medication_name(name), name.strip())
+    if not names_by_key:
+        return [], []
+
+    fields = ("id", "name", "normalized_name")
+    by_key = {
+        medication.normalized_name: medication
+        for medication in Medication.objects.filter(
+            normalized_name__in=names_by_key
+        ).only(*fields)
+    }
+
+    missing = [key for key in names_by_key if key not in by_key]
+    created_ids = []
+    if missing:
+        created_ids = _insert_missing(
+            [
+                Medication(name=names_by_key[key], normalized_name=key)
+                for key in missing
+            ]
+        )
+        for medication in Medication.objects.filter(
+            normalized_name__in=missing
+        ).only(*fields):
+            by_key[medication.normalized_name] = medication
+
+    return [by_key[key] for key in names_by_key], created_ids
+
+
+def _insert_missing(medications):
+    """Insert ``medications``, skipping names that already have a row.
+
+    Unlike ``bulk_create(ignore_conflicts=True)``, the ``RETURNING`` clause
+    reports which rows were actually inserted here. Returns their ids.
+    """
+    fields = [field for field in Medication._meta.concrete_fields if not field.primary_key]
+    qn = connection.ops.quote_name
+    row = f"({', '.join(['%s'] * len(fields))})"
+    batch_size = connection.ops.bulk_batch_size(fields, medications)
+
+    ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(medications), batch_size):
+            batch = medications[start : start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {qn(Medication._meta.db_table)} "
+                f"({', '.join(qn(field.column) for field in fields)}) "
+                f"VALUES {', '.join([row] * len(batch))} "
+                f"ON CONFLICT ({qn('normalized_name')}) DO NOTHING "
+                f"RETURNING {qn('id')}",
+                [
+                    field.get_db_prep_save(field.pre_save(medication, True), connection)
+                    for medication in batch
+                    for field in fields
+                ],
+            )
+            ids += [pk for pk, in cursor.fetchall()]
+    return ids
+
+
+def set_record_medications(record, medications, is_new=False):
+    """Replace the medications of a record, writing only the through-row diff.
+
+    ``is_new`` skips reading the current links for a record that was just
+    created, so a fresh record costs a single insert.
+    """
+    through = MedicalRecord.medications.through
+    wanted = {medication.id for medication in medications}
+
+    current = set()
+    if not is_new:
+        current = set(
+            through.objects.filter(medicalrecord_id=record.id).values_list(
+                "medication_id", flat=True
+            )
+        )
+
+    removed = current - wanted
+    if removed:
+        through.objects.filter(
+            medicalrecord_id=record.id, medication_id__in=removed
+        ).delete()
+
+    added = wanted - current
+    if added:
+        through.objects.bulk_create(
+            [
+                through(medicalrecord_id=record.id, medication_id=medication_id)
+                for medication_id in added
+            ]
+        )
+
+    # The through rows are written without m2m_changed signals.
+    if added or removed:
+        bump_versions("medical_records", record.patient_id, "all")
+
+
+def _clean_import_item(item):
+    """Validate one import item without touching the database.
+
+    Returns ``(row, errors)`` where ``row`` holds ``patient_id``,
+    ``description`` and ``medications`` when ``errors`` is empty.
+    """
+    if not isinstance(item, dict):
+        return None, {"non_field_errors": ["Expected an object."]}
+
+    errors = {}
+    row = {}
+
+    patient_id = item.get("patient_id")
+    if patient_id in (None, ""):
+        errors["patient_id"] = ["This field is required."]
+    else:
+        try:
+            row["patient_id"] = int(patient_id)
+        except (TypeError, ValueError):
+            errors["patient_id"] = ["Invalid user ID format"]
+
+    description = item.get("description")
+    if not isinstance(description, str) or not description.strip():
+        errors["description"] = ["This field is required."]
+    else:
+        row["description"] = description
+
+    medications = item.get("medications", [])
+    if not isinstance(medications, list) or not all(
+        isinstance(name, str) for name in medications
+    ):
+        errors["medications"] = ["Expected a list of medication names."]
+    else:
+        by_key = {}
+        for name in medications:
+            if name.strip():
+                by_key.setdefault(normalize_medication_name(name), name.strip())
+        row["medications"] = list(by_key.values())
+
+    return row, errors
+
+
+def import_medical_records(items, doctor, batch_size=1000):
+    """Create medical records for ``doctor`` from a list of plain dicts.
+
+    Items are validated in memory, every referenced patient is checked with a
+    single query and every distinct medication name is resolved once. Valid
+    records and their medication links are then written with chunked
+    ``bulk_create`` calls inside one transaction; invalid items are skipped
+    and reported.
+
+    Returns ``(records, errors, created_medication_ids)`` where ``errors`` is
+    a list of ``{"index": ..., "errors": {...}}`` in input order.
+    """
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        row, item_errors = _clean_import_item(item)
+        if item_errors:
+            errors.append({"index": index, "errors": item_errors})
+        else:
+            rows.append((index, row))
+
+    patient_ids = set(
+        get_user_model()
+        .objects.filter(id__in={row["patient_id"] for _, row in rows})
+        .values_list("id", flat=True)
+    )
+    valid_rows = []
+    for index, row in rows:
+        if row["patient_id"] in patient_ids:
+            valid_rows.append(row)
+        else:
+            errors.append(
+                {"index": index, "errors": {"patient_id": ["No user found with this ID"]}}
+            )
+    errors.sort(key=lambda error: error["index"])
+
+    with transaction.atomic():
+        medications, created_ids = resolve_medications(
+            name for row in valid_rows for name in row["medications"]
+        )
+        medication_ids = {
+            medication.normalized_name: medication.id for medication in medications
+        }
+
+        records = MedicalRecord.objects.bulk_create(
+            [
+                MedicalRecord(
+                    patient_id=row["patient_id"],
+                    doctor=doctor,
+                    description=row["description"],
+                )
+                for row in valid_rows
+            ],
+            batch_size=batch_size,
+        )
+
+        through = MedicalRecord.medications.through
+        through.objects.bulk_create(
+            [
+                through(
+                    medicalrecord_id=record.id,
+                    medication_id=medication_ids[normalize_medication_name(name)],
+                )
+                for record, row in zip(records, valid_rows)
+                for name in row["medications"]
+            ],
+            batch_size=batch_size,
+        )
+
+        bump_versions(
+            "medical_records", *{record.patient_id for record in records}, "all"
+        )
+
+    return records, errors, created_ids
+
+
+def search_medications(query, limit):
+    """Rank local medications matching ``query`` for type-ahead.
+
+    Prefix matches on any searchable name come first, then fuzzy matches by
+    trigram word similarity. On PostgreSQL the filter only uses the trigram
+    operator, so it is served by the ``gin_trgm_ops`` indexes (a prefix of a
+    word is itself a close word match); other databases fall back to
+    ``icontains``.
+    """
+    prefix_match = Q()
+    for field in SEARCH_FIELDS:
+        prefix_match |= Q(**{f"{field}__istartswith": query})
+
+    queryset = Medication.objects.annotate(
+        is_prefix=Case(
+            When(prefix_match, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+    if connection.vendor == "postgresql":
+        fuzzy_match = Q()
+        for field in SEARCH_FIELDS:
+            fuzzy_match |= Q(**{f"{field}__trigram_word_similar": query})
+        queryset = queryset.annotate(
+            similarity=Greatest(
+                *(
+                    Coalesce(TrigramWordSimilarity(query, field), Value(0.0))
+                    for field in SEARCH_FIELDS
+                ),
+                output_field=FloatField(),
+            )
+        ).filter(fuzzy_match)
+    else:
+        contains_match = Q()
+        for field in SEARCH_FIELDS:
+            contains_match |= Q(**{f"{field}__icontains": query})
+        queryset = queryset.annotate(
+            similarity=Value(0.0, output_field=FloatField())
+        ).filter(contains_match)
+
+    return list(
+        queryset.order_by("-is_prefix", F("similarity").desc(), "name")[:limit]
+    )
@@ -0,0 +1,27 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from medical_records.models import MedicalRecord, Medication
+from src.versioning import bump_versions
+
+
+@receiver([post_save, post_delete], sender=MedicalRecord)
+def bump_medical_record_versions(sender, instance, **kwargs):
+    bump_versions("medical_records", instance.patient_id, "all")
+
+
+@receiver(m2m_changed, sender=MedicalRecord.medications.through)
+def bump_medical_record_medication_versions(
+    sender, instance, action, reverse, **kwargs
+):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        bump_versions("medications", "all")
+    else:
+        bump_versions("medical_records", instance.patient_id, "all")
+
+
+@receiver([post_save, post_delete], sender=Medication)
+def bump_medication_versions(sender, instance, **kwargs):
+    bump_versions("medications", "all")
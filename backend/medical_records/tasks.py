@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from celery import shared_task
+
+from src.versioning import bump_versions
+
+from .models import (
+    MedicalRecord,
+    Medication,
+    MedicationPayload,
+    normalize_medication_name,
+)
+from .utils import (
+    ENRICHED_FIELDS,
+    apply_medication_data,
+    fetch_medication_data,
+    save_medication_payloads,
+)
+
+ENRICH_WATERMARK_KEY = "medications:enrich:watermark"
+
+
+@shared_task
+def enrich_medications(medication_ids=None, batch_size=None):
+    """Fill in openFDA data for medications still marked as enrichment pending.
+
+    Names are deduplicated so each distinct drug is fetched once, and the
+    upstream calls run concurrently on a small thread pool. Drugs openFDA has
+    no results for are marked as done; rows whose lookup fails stay pending.
+
+    Without ``medication_ids`` this is the periodic run from the beat
+    schedule: it takes the next ``batch_size`` pending rows after a cache
+    watermark, so rows that keep failing cannot starve the rest, and wraps
+    around once it reaches the end.
+    """
+    pending = Medication.objects.filter(enrichment_pending=True)
+    if medication_ids is not None:
+        medications = list(pending.filter(id__in=medication_ids).only("id", "name"))
+    else:
+        batch_size = batch_size or settings.MEDICATION_ENRICH_BATCH_SIZE
+        watermark = cache.get(ENRICH_WATERMARK_KEY, 0)
+        medications = list(
+            pending.filter(id__gt=watermark).order_by("id").only("id", "name")[
+                :batch_size
+            ]
+        )
+        cache.set(
+            ENRICH_WATERMARK_KEY,
+            medications[-1].id if len(medications) == batch_size else 0,
+            timeout=None,
+        )
+    if not medications:
+        return "No medications pending enrichment."
+
+    names = sorted({medication.name for medication in medications})
+    with ThreadPoolExecutor(max_workers=settings.OPENFDA_MAX_WORKERS) as executor:
+        results = dict(zip(names, executor.map(fetch_medication_data, names)))
+
+    enriched = []
+    payloads = {}
+    not_found = []
+    for medication in medications:
+        data, status_code, _ = results[medication.name]
+        if status_code == 200 and data:
+            apply_medication_data(medication, data)
+            payloads[medication.id] = data.get("raw_data")
+            medication.enrichment_pending = False
+            enriched.append(medication)
+        elif status_code == 404:
+            not_found.append(medication.id)
+
+    Medication.objects.bulk_update(
+        enriched, fields=[*ENRICHED_FIELDS, "enrichment_pending"]
+    )
+    save_medication_payloads(payloads)
+    Medication.objects.filter(id__in=not_found).update(enrichment_pending=False)
+    bump_versions("medications", "all")
+    return f"Enriched {len(enriched)} of {len(medications)} pending medications."
+
+
+@shared_task
+def merge_duplicate_medications(batch_size=500):
+    """Fold legacy duplicate medications into their canonical rows, one batch per run.
+
+    Duplicates are the rows left without a ``normalized_name`` by migration
+    0009. For each one the medical record links are moved to the canonical
+    row with set-based through-table writes, enriched data and the raw payload
+    are carried over when the canonical row lacks them, and the duplicate is
+    deleted. A full batch re-queues the task for the next one.
+    """
+    duplicates = list(
+        Medication.objects.filter(normalized_name__isnull=True).order_by("id")[
+            :batch_size
+        ]
+    )
+    if not duplicates:
+        return "No duplicate medications left."
+
+    keys = {
+        medication.id: normalize_medication_name(medication.name)
+        for medication in duplicates
+    }
+    with transaction.atomic():
+        canonical = {
+            medication.normalized_name: medication
+            for medication in Medication.objects.select_for_update().filter(
+                normalized_name__in=set(keys.values())
+            )
+        }
+
+        merged = {}
+        for duplicate in duplicates:
+            key = keys[duplicate.id]
+            target = canonical.get(key)
+            if target is None:
+                # No canonical row yet: this duplicate becomes it. Nothing
+                # is locked for the key, so a concurrent resolve_medications
+                # may insert it first; the savepoint keeps that conflict from
+                # rolling back the batch and the new row is merged into.
+                duplicate.normalized_name = key
+                try:
+                    with transaction.atomic():
+                        duplicate.save(update_fields=["normalized_name"])
+                except IntegrityError:
+                    duplicate.normalized_name = None
+                    target = Medication.objects.select_for_update().get(
+                        normalized_name=key
+                    )
+                    canonical[key] = target
+                else:
+                    canonical[key] = duplicate
+                    continue
+
+            merged[duplicate.id] = target.id
+            if target.enrichment_pending and not duplicate.enrichment_pending:
+                for field in ENRICHED_FIELDS:
+                    setattr(target, field, getattr(duplicate, field))
+                target.enrichment_pending = False
+                target.save(update_fields=[*ENRICHED_FIELDS, "enrichment_pending"])
+                MedicationPayload.objects.filter(medication_id=target.id).delete()
+                MedicationPayload.objects.filter(medication_id=duplicate.id).update(
+                    medication_id=target.id
+                )
+
+        through = MedicalRecord.medications.through
+        links = list(
+            through.objects.filter(medication_id__in=merged).values_list(
+                "medicalrecord_id", "medication_id"
+            )
+        )
+        through.objects.bulk_create(
+            [
+                through(medicalrecord_id=record_id, medication_id=merged[medication_id])
+                for record_id, medication_id in links
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        through.objects.filter(medication_id__in=merged).delete()
+        Medication.objects.filter(id__in=merged).delete()
+
+        patient_ids = MedicalRecord.objects.filter(
+            id__in={record_id for record_id, _ in links}
+        ).values_list("patient_id", flat=True)
+        bump_versions("medical_records", *patient_ids, "all")
+
+    if len(duplicates) == batch_size:
+        merge_duplicate_medications.delay(batch_size)
+    return f"Merged {len(merged)} of {len(duplicates)} duplicate medications."
@@ -1,3 +1,1151 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import pytest
+import requests
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from rest_framework import viewsets
+from rest_framework_simplejwt.tokens import AccessToken
+
+from medical_records import openfda, services, tasks, utils
+from medical_records.cache import LocalCache
+from medical_records.management.commands import import_openfda_dump
+from medical_records.models import MedicalRecord, Medication, OpenFDAImport
+from medical_records.openfda import (
+    AsyncOpenFDAClient,
+    CircuitBreaker,
+    OpenFDAClient,
+    breaker_state_changed,
+    get_client,
+)
+from medical_records.services import resolve_medications, set_record_medications
+from medical_records.utils import cache_stats, fetch_medication_data, local_cache
+from src.asgi_middleware import CancelOnDisconnectMiddleware
+from src.mixins import ConditionalGetMixin
+
+OPENFDA_PAYLOAD = {
+    "results": [
+        {
+            "patient": {
+                "reaction": [{"reactionmeddrapt": "HEADACHE"}],
+                "drug": [
+                    {
+                        "medicinalproduct": "ASPIRIN",
+                        "openfda": {
+                            "brand_name": ["BAYER ASPIRIN"],
+                            "generic_name": ["ASPIRIN"],
+                            "route": ["ORAL"],
+                        },
+                    }
+                ],
+            }
+        }
+    ]
+}
+
+
+class StubOpenFDAClient:
+    """Serve ``payload`` as the first page; later pages come from ``pages``.
+
+    Only first-page requests are recorded in ``calls``, one per lookup.
+    """
+
+    def __init__(self, payload=OPENFDA_PAYLOAD, delay=0, pages=(), barrier=None):
+        self.payload = payload
+        self.delay = delay
+        self.pages = list(pages)
+        self.barrier = barrier
+        self.calls = []
+        self.skips = []
+        self._lock = threading.Lock()
+
+    def drug_events(self, query, limit=5, skip=0):
+        with self._lock:
+            self.skips.append(skip)
+            if not skip:
+                self.calls.append(query)
+        time.sleep(self.delay)
+        if skip:
+            if self.barrier:
+                self.barrier.wait(timeout=5)
+            page = skip // limit - 1
+            if page >= len(self.pages):
+                raise http_error(404)
+            if isinstance(self.pages[page], Exception):
+                raise self.pages[page]
+            return self.pages[page]
+        if isinstance(self.payload, Exception):
+            raise self.payload
+        return self.payload
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+
+class FlakyOpenFDAHandler(BaseHTTPRequestHandler):
+    """Answer 503 with ``Retry-After: 0`` once, then the stub payload."""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.client_address)
+        if len(self.requests) == 1:
+            status, body = 503, b"{}"
+        else:
+            status, body = 200, json.dumps(OPENFDA_PAYLOAD).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_openfda_client_retries_on_a_pooled_connection(settings):
+    FlakyOpenFDAHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyOpenFDAHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = OpenFDAClient(
+        base_url=f"http://127.0.0.1:{server.server_address[1]}",
+        backoff_factor=0,
+    )
+    try:
+        first = client.drug_events("aspirin")
+        second = client.drug_events("aspirin")
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+    assert first == second == OPENFDA_PAYLOAD
+    # The 503 was retried, and every request reused one keep-alive connection.
+    assert len(FlakyOpenFDAHandler.requests) == 3
+    assert len(set(FlakyOpenFDAHandler.requests)) == 1
+    assert client.timeout == (
+        settings.OPENFDA_CONNECT_TIMEOUT,
+        settings.OPENFDA_READ_TIMEOUT,
+    )
+
+
+def test_get_client_is_shared_until_the_process_forks():
+    client = get_client()
+    assert get_client() is client
+    with mock.patch.object(openfda.os, "getpid", return_value=-1):
+        forked = get_client()
+    assert forked is not client
+    forked.close()
+
+
+def test_fetch_medication_data_caches_result():
+    client = StubOpenFDAClient()
+    with mock.patch.object(utils, "get_client", return_value=client):
+        data, status_code, _ = fetch_medication_data("Aspirin")
+        cached, cached_status, message = fetch_medication_data(" aspirin ")
+
+    assert status_code == cached_status == 200
+    assert data["extracted_info"]["brand_names"] == ["BAYER ASPIRIN"]
+    assert cached == data
+    assert message == "Data retrieved from cache"
+    assert client.calls == ["aspirin"]
+
+
+def test_pages_are_fetched_concurrently_and_folded(settings):
+    settings.OPENFDA_PAGE_SIZE = 1
+    settings.OPENFDA_PAGES = 4
+    settings.OPENFDA_TOP_REACTIONS = 2
+    settings.OPENFDA_RAW_SAMPLE_SIZE = 1
+    nausea = {
+        "results": [
+            {
+                "patient": {
+                    "reaction": [
+                        {"reactionmeddrapt": "NAUSEA"},
+                        {"reactionmeddrapt": "RASH"},
+                    ],
+                    "drug": [{"drugdosageform": "TABLET"}],
+                }
+            }
+        ]
+    }
+    # The later pages only get past the barrier if all three are in flight.
+    client = StubOpenFDAClient(pages=[nausea, nausea], barrier=threading.Barrier(3))
+    with mock.patch.object(utils, "get_client", return_value=client):
+        data, status_code, _ = fetch_medication_data("aspirin")
+
+    assert status_code == 200
+    assert sorted(client.skips) == [0, 1, 2, 3]
+    extracted = data["extracted_info"]
+    assert extracted["reactions"][0] == "NAUSEA"
+    assert extracted["reaction_counts"] == [["NAUSEA", 2], ["RASH", 2]]
+    assert extracted["dosage_forms"] == ["TABLET"]
+    assert data["raw_data"] == OPENFDA_PAYLOAD
+
+
+def test_later_pages_are_fetched_only_when_needed_and_may_fail(settings):
+    settings.OPENFDA_PAGE_SIZE = 1
+    settings.OPENFDA_PAGES = 3
+    client = StubOpenFDAClient(pages=[http_error(502)])
+    with mock.patch.object(utils, "get_client", return_value=client):
+        data, status_code, _ = fetch_medication_data("aspirin")
+
+    assert status_code == 200
+    assert sorted(client.skips) == [0, 1, 2]
+    assert data["extracted_info"]["reactions"] == ["HEADACHE"]
+
+    settings.OPENFDA_PAGE_SIZE = 2
+    client = StubOpenFDAClient()
+    with mock.patch.object(utils, "get_client", return_value=client):
+        fetch_medication_data("ibuprofen")
+
+    assert client.skips == [0]
+
+
+def test_concurrent_fetches_share_one_upstream_call(settings):
+    settings.OPENFDA_LOCK_POLL_INTERVAL = 0.01
+    client = StubOpenFDAClient(delay=0.2)
+    callers = 16
+    barrier = threading.Barrier(callers)
+    results = []
+
+    def call():
+        barrier.wait()
+        results.append(fetch_medication_data("ASPIRIN"))
+
+    with mock.patch.object(utils, "get_client", return_value=client):
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(client.calls) == 1
+    assert len(results) == callers
+    assert all(status_code == 200 for _, status_code, _ in results)
+
+
+def test_hot_lookups_are_served_from_the_local_tier():
+    client = StubOpenFDAClient()
+    with mock.patch.object(utils, "get_client", return_value=client):
+        fetch_medication_data("aspirin")
+        fetch_medication_data("aspirin")
+
+        local_cache.clear()
+        fetch_medication_data("aspirin")
+
+    assert client.calls == ["aspirin"]
+    assert cache_stats.snapshot() == {
+        "local": {"hits": 1, "misses": 2},
+        "shared": {"hits": 1, "misses": 1},
+    }
+
+
+def test_stale_entry_is_served_while_refreshing():
+    client = StubOpenFDAClient()
+    stale = {"raw_data": {}, "extracted_info": {"brand_names": ["OLD"]}}
+    cache.set("openfda:v2:aspirin", {"data": stale, "fresh_until": time.time() - 1})
+
+    with mock.patch.object(utils, "get_client", return_value=client):
+        data, status_code, _ = fetch_medication_data("aspirin")
+        for _ in range(100):
+            if cache.get("openfda:v2:aspirin")["data"] != stale:
+                break
+            time.sleep(0.01)
+
+    assert status_code == 200
+    assert data == stale
+    assert client.calls == ["aspirin"]
+    refreshed = cache.get("openfda:v2:aspirin")
+    assert refreshed["data"]["extracted_info"]["brand_names"] == ["BAYER ASPIRIN"]
+    assert refreshed["fresh_until"] > time.time()
+
+
+def test_stale_local_copy_does_not_refresh_a_fresh_shared_entry():
+    client = StubOpenFDAClient()
+    stale = {"raw_data": {}, "extracted_info": {"brand_names": ["OLD"]}}
+    fresh = {"raw_data": {}, "extracted_info": {"brand_names": ["NEW"]}}
+    local_cache.set("openfda:v2:aspirin", {"data": stale, "fresh_until": time.time() - 1})
+    cache.set("openfda:v2:aspirin", {"data": fresh, "fresh_until": time.time() + 60})
+
+    with mock.patch.object(utils, "get_client", return_value=client):
+        first, _, _ = fetch_medication_data("aspirin")
+        second, _, _ = fetch_medication_data("aspirin")
+
+    assert first == stale
+    assert second == fresh
+    assert client.calls == []
+
+
+def test_local_cache_evicts_least_recently_used():
+    lru = LocalCache(max_size=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("a") == 1
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
+
+
+def test_lookups_without_results_are_cached():
+    client = StubOpenFDAClient(payload=http_error(404))
+    with mock.patch.object(utils, "get_client", return_value=client):
+        first = fetch_medication_data("notadrug")
+        local_cache.clear()
+        second = fetch_medication_data("notadrug")
+
+    assert first[:2] == second[:2] == (None, 404)
+    assert client.calls == ["notadrug"]
+
+
+def test_upstream_errors_are_cached_briefly(settings):
+    settings.OPENFDA_ERROR_CACHE_TTL = 1
+    client = StubOpenFDAClient(payload=http_error(502))
+    with mock.patch.object(utils, "get_client", return_value=client):
+        assert fetch_medication_data("aspirin")[1] == 500
+        assert fetch_medication_data("aspirin")[1] == 500
+        assert client.calls == ["aspirin"]
+
+        time.sleep(1.1)
+        fetch_medication_data("aspirin")
+
+    assert client.calls == ["aspirin", "aspirin"]
+
+
+def test_circuit_breaker_opens_and_recovers_after_probe(settings):
+    settings.OPENFDA_BREAKER_MIN_CALLS = 4
+    settings.OPENFDA_BREAKER_FAILURE_RATE = 0.5
+    settings.OPENFDA_BREAKER_OPEN_SECONDS = 1
+    circuit = CircuitBreaker("test")
+    changes = []
+
+    def on_change(sender, name, previous, state, **kwargs):
+        changes.append((previous, state))
+
+    breaker_state_changed.connect(on_change)
+    try:
+        circuit.record_success()
+        circuit.record_success()
+        circuit.record_failure()
+        assert circuit.state() == CircuitBreaker.CLOSED
+        circuit.record_failure()
+        assert circuit.state() == CircuitBreaker.OPEN
+        assert not circuit.allow_request()
+
+        time.sleep(1.1)
+        assert circuit.state() == CircuitBreaker.HALF_OPEN
+        assert circuit.allow_request()
+        assert not circuit.allow_request()
+        circuit.record_success()
+    finally:
+        breaker_state_changed.disconnect(on_change)
+
+    assert circuit.state() == CircuitBreaker.CLOSED
+    assert changes == [
+        (CircuitBreaker.CLOSED, CircuitBreaker.OPEN),
+        (CircuitBreaker.HALF_OPEN, CircuitBreaker.CLOSED),
+    ]
+
+
+@pytest.mark.django_db
+def test_record_medications_are_resolved_and_linked_with_set_queries(doctor, patient):
+    Medication.objects.create(name="aspirin")
+    record = MedicalRecord.objects.create(
+        patient=patient, doctor=doctor, description="Headache"
+    )
+
+    with CaptureQueriesContext(connection) as queries:
+        medications, created_ids = resolve_medications(
+            ["aspirin", "ibuprofen", "dipyrone", "Aspirin"]
+        )
+    # One read, one insert of the missing rows, one read back.
+    assert len(queries) == 3
+    assert [m.name for m in medications] == ["aspirin", "ibuprofen", "dipyrone"]
+    assert len(created_ids) == 2
+
+    set_record_medications(record, medications[:2])
+    with CaptureQueriesContext(connection) as queries:
+        set_record_medications(record, medications[1:])
+    # Current links, one delete for the removed one, one insert for the new one.
+    assert len(queries) == 3
+    assert set(record.medications.values_list("name", flat=True)) == {
+        "ibuprofen",
+        "dipyrone",
+    }
+
+    with CaptureQueriesContext(connection) as queries:
+        set_record_medications(record, medications[1:])
+    assert len(queries) == 1
+
+
+@pytest.mark.django_db
+def test_record_create_enriches_new_medications_after_commit(
+    api_client, doctor, patient, django_capture_on_commit_callbacks
+):
+    Medication.objects.create(name="aspirin")
+    api_client.force_authenticate(doctor)
+
+    with mock.patch.object(tasks.enrich_medications, "delay") as delay:
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = api_client.post(
+                "/api/v1/medical-records/",
+                {
+                    "patient_id": patient.id,
+                    "description": "Fever",
+                    "medications": ["Aspirin", "Ibuprofen", " ibuprofen ", "Dipyrone"],
+                },
+                format="json",
+            )
+        assert response.status_code == 201
+        delay.assert_not_called()
+        for callback in callbacks:
+            callback()
+
+    new_ids = set(
+        Medication.objects.filter(name__in=["Ibuprofen", "Dipyrone"]).values_list(
+            "id", flat=True
+        )
+    )
+    delay.assert_called_once()
+    assert set(delay.call_args.args[0]) == new_ids
+    assert Medication.objects.filter(enrichment_pending=True).count() == 3
+
+
+@pytest.mark.django_db
+def test_enrichment_fetches_each_name_once_and_writes_one_update():
+    medications = [Medication.objects.create(name=name) for name in ("aspirin", "x")]
+    # A legacy duplicate without a normalized key shares its name.
+    duplicate = Medication.objects.create(name="aspirin-old")
+    Medication.objects.filter(id=duplicate.id).update(
+        name="aspirin", normalized_name=None
+    )
+    client = StubOpenFDAClient()
+
+    with mock.patch.object(utils, "get_client", return_value=client):
+        with CaptureQueriesContext(connection) as queries:
+            result = tasks.enrich_medications([m.id for m in medications] + [duplicate.id])
+
+    assert sorted(client.calls) == ["aspirin", "x"]
+    assert result == "Enriched 3 of 3 pending medications."
+    updates = [
+        q["sql"]
+        for q in queries
+        if q["sql"].startswith('UPDATE "medical_records_medication"')
+    ]
+    assert len(updates) == 1
+    assert not Medication.objects.filter(enrichment_pending=True).exists()
+
+
+@pytest.mark.django_db
+def test_periodic_enrichment_walks_pending_rows_in_batches():
+    for name in ("a", "b", "c"):
+        Medication.objects.create(name=name)
+    client = StubOpenFDAClient(payload=http_error(500))
+
+    with mock.patch.object(utils, "get_client", return_value=client):
+        tasks.enrich_medications(batch_size=2)
+        assert cache.get(tasks.ENRICH_WATERMARK_KEY) > 0
+        tasks.enrich_medications(batch_size=2)
+
+    # Failing rows stay pending but do not hold back the rows after them.
+    assert client.calls == ["a", "b", "c"]
+    assert Medication.objects.filter(enrichment_pending=True).count() == 3
+    assert cache.get(tasks.ENRICH_WATERMARK_KEY) == 0
+
+
+@pytest.mark.django_db
+def test_enrichment_keeps_raw_payload_out_of_record_responses(
+    api_client, doctor, patient
+):
+    medication = Medication.objects.create(name="aspirin")
+    record = MedicalRecord.objects.create(
+        patient=patient, doctor=doctor, description="Headache"
+    )
+    record.medications.add(medication)
+
+    with mock.patch.object(utils, "get_client", return_value=StubOpenFDAClient()):
+        tasks.enrich_medications([medication.id])
+
+    medication.refresh_from_db()
+    assert medication.brand_name == "BAYER ASPIRIN"
+    assert not medication.enrichment_pending
+
+    api_client.force_authenticate(doctor)
+    listed = api_client.get("/api/v1/medical-records/?expand=medications").json()
+    assert listed["results"][0]["medications"][0]["brand_name"] == "BAYER ASPIRIN"
+    assert "external_data" not in listed["results"][0]["medications"][0]
+
+    payload = api_client.get(f"/api/v1/medications/{medication.id}/external-data/")
+    assert payload.status_code == 200
+    assert payload.json()["data"] == OPENFDA_PAYLOAD
+
+
+@pytest.mark.django_db
+def test_medical_records_are_keyset_paginated(api_client, doctor, patient):
+    records = [
+        MedicalRecord.objects.create(patient=patient, doctor=doctor, description=str(i))
+        for i in range(5)
+    ]
+    api_client.force_authenticate(doctor)
+
+    seen = []
+    url = "/api/v1/medical-records/?page_size=2"
+    while url:
+        page = api_client.get(url).json()
+        seen.extend(item["id"] for item in page["results"])
+        url = page["next"]
+
+    assert seen == [record.id for record in reversed(records)]
+
+    last_page = api_client.get(page["previous"]).json()
+    assert [item["id"] for item in last_page["results"]] == seen[2:4]
+
+
+@pytest.mark.django_db
+def test_medical_record_list_query_count_does_not_grow_with_rows(
+    api_client, doctor, patient
+):
+    medications = [Medication.objects.create(name=f"drug-{i}") for i in range(3)]
+
+    def create_records(count):
+        for i in range(count):
+            record = MedicalRecord.objects.create(
+                patient=patient, doctor=doctor, description=str(i)
+            )
+            record.medications.add(*medications)
+
+    def count_list_queries():
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(
+                "/api/v1/medical-records/?page_size=200&expand=medications"
+            )
+        assert response.status_code == 200
+        return len(queries), len(response.json()["results"])
+
+    api_client.force_authenticate(doctor)
+
+    create_records(5)
+    small_count, small_rows = count_list_queries()
+
+    create_records(45)
+    large_count, large_rows = count_list_queries()
+
+    assert (small_rows, large_rows) == (5, 50)
+    assert large_count == small_count
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets_keep_the_cursor_columns(api_client, doctor, patient):
+    for description in ("First", "Second"):
+        MedicalRecord.objects.create(patient=patient, doctor=doctor, description=description)
+    api_client.force_authenticate(doctor)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get("/api/v1/medical-records/?fields=id&page_size=1")
+
+    assert response.json()["next"] is not None
+    assert len(queries) == 1
+    assert "created_at" in queries[0]["sql"].split(" FROM ")[0]
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets_skip_unrequested_relations(api_client, doctor, patient):
+    record = MedicalRecord.objects.create(
+        patient=patient, doctor=doctor, description="Checkup"
+    )
+    record.medications.add(Medication.objects.create(name="aspirin"))
+    api_client.force_authenticate(doctor)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get("/api/v1/medical-records/?fields=id,patient_name")
+
+    assert response.json()["results"] == [
+        {"id": record.id, "patient_name": "patient"}
+    ]
+    assert len(queries) == 1
+    assert "medication" not in queries[0]["sql"]
+    assert "description" not in queries[0]["sql"]
+
+    expanded = api_client.get(
+        f"/api/v1/medical-records/{record.id}/?fields=id,doctor&expand=doctor"
+    ).json()
+    assert expanded == {
+        "id": record.id,
+        "doctor": {
+            "id": doctor.id,
+            "username": "doctor",
+            "email": "doc@example.com",
+            "is_doctor": True,
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_medication_search_prefers_local_catalog(api_client, patient):
+    Medication.objects.create(name="Aspirin", brand_name="BAYER ASPIRIN")
+    Medication.objects.create(name="Ibuprofen", generic_name="IBUPROFEN")
+    Medication.objects.create(name="Baby aspirin")
+    api_client.force_authenticate(patient)
+    client = StubOpenFDAClient()
+
+    with mock.patch.object(utils, "get_client", return_value=client):
+        local = api_client.get("/api/v1/medications/search/?q=aspi&limit=2").json()
+        remote = api_client.get("/api/v1/medications/search/?q=ibupro").json()
+
+    assert local["source"] == "local"
+    assert [item["name"] for item in local["results"]] == ["Aspirin", "Baby aspirin"]
+    assert remote["source"] == "openfda"
+    assert [item["name"] for item in remote["results"]] == ["Ibuprofen"]
+    assert remote["external"]["brand_names"] == ["BAYER ASPIRIN"]
+    assert client.calls == ["ibupro"]
+
+
+def stub_async_client(delay=0):
+    calls = []
+
+    async def handler(request):
+        if "skip" in request.url.params:
+            return httpx.Response(404, json={})
+        calls.append(request.url.params["search"])
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json=OPENFDA_PAYLOAD)
+
+    client = AsyncOpenFDAClient(
+        base_url="https://openfda.test", transport=httpx.MockTransport(handler)
+    )
+    return client, calls
+
+
+def test_async_lookups_share_one_upstream_call():
+    client, calls = stub_async_client(delay=0.1)
+
+    async def search():
+        return await asyncio.gather(
+            *(utils.afetch_medication_data("Aspirin") for _ in range(50))
+        )
+
+    with mock.patch.object(utils, "get_async_client", return_value=client):
+        results = asyncio.run(search())
+
+    assert {status_code for _, status_code, _ in results} == {200}
+    assert calls == ["patient.drug.medicinalproduct:aspirin"]
+    assert cache.get("openfda:v2:aspirin")["data"] == results[0][0]
+
+
+def test_async_later_pages_are_bounded_by_the_page_workers(settings):
+    settings.OPENFDA_PAGE_SIZE = 1
+    settings.OPENFDA_PAGES = 20
+    settings.OPENFDA_PAGE_WORKERS = 3
+    in_flight = []
+    peak = 0
+
+    async def handler(request):
+        nonlocal peak
+        in_flight.append(request)
+        peak = max(peak, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(request)
+        return httpx.Response(200, json=OPENFDA_PAYLOAD)
+
+    client = AsyncOpenFDAClient(
+        base_url="https://openfda.test", transport=httpx.MockTransport(handler)
+    )
+    with mock.patch.object(utils, "get_async_client", return_value=client):
+        _, extracted = asyncio.run(utils.afetch_drug_events("aspirin"))
+
+    assert extracted["reaction_counts"] == [["HEADACHE", 20]]
+    assert peak == 3
+
+
+@pytest.mark.django_db
+def test_wsgi_external_search_uses_the_sync_client(client, doctor):
+    token = AccessToken.for_user(doctor)
+    sync_client = StubOpenFDAClient()
+
+    with mock.patch.object(
+        utils, "get_client", return_value=sync_client
+    ), mock.patch.object(utils, "get_async_client") as get_async_client:
+        anonymous = client.post(
+            "/api/v1/medical-records/external-search/",
+            {"query": "aspirin"},
+            content_type="application/json",
+        )
+        response = client.post(
+            "/api/v1/medical-records/external-search/",
+            {"query": "aspirin"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+
+    assert anonymous.status_code == 401
+    assert response.status_code == 200
+    assert response.json()["extracted_info"]["brand_names"] == ["BAYER ASPIRIN"]
+    assert sync_client.calls == ["aspirin"]
+    get_async_client.assert_not_called()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_asgi_external_search_uses_the_async_client(doctor):
+    from src.asgi import application
+
+    async_client, calls = stub_async_client()
+    token = AccessToken.for_user(doctor)
+    body = json.dumps({"query": "aspirin"}).encode()
+
+    async def post():
+        communicator = ApplicationCommunicator(
+            application,
+            {
+                "type": "http",
+                "method": "POST",
+                "path": "/api/v1/medical-records/external-search/",
+                "query_string": b"",
+                "server": ("testserver", 80),
+                "headers": [
+                    (b"authorization", f"Bearer {token}".encode()),
+                    (b"content-type", b"application/json"),
+                ],
+            },
+        )
+        await communicator.send_input(
+            {"type": "http.request", "body": body, "more_body": False}
+        )
+        start = await communicator.receive_output(timeout=5)
+        response = await communicator.receive_output(timeout=5)
+        await communicator.wait()
+        return start["status"], json.loads(response["body"])
+
+    with mock.patch.object(utils, "get_async_client", return_value=async_client):
+        status_code, data = asyncio.run(post())
+
+    assert status_code == 200
+    assert data["extracted_info"]["brand_names"] == ["BAYER ASPIRIN"]
+    assert calls == ["patient.drug.medicinalproduct:aspirin"]
+
+
+def test_lifespan_shutdown_closes_the_async_client():
+    from src.asgi import application
+
+    async def serve():
+        client = openfda.get_async_client()
+        communicator = ApplicationCommunicator(application, {"type": "lifespan"})
+        await communicator.send_input({"type": "lifespan.startup"})
+        startup = await communicator.receive_output(timeout=1)
+        await communicator.send_input({"type": "lifespan.shutdown"})
+        shutdown = await communicator.receive_output(timeout=1)
+        return client, startup, shutdown
+
+    client, startup, shutdown = asyncio.run(serve())
+
+    assert startup == {"type": "lifespan.startup.complete"}
+    assert shutdown == {"type": "lifespan.shutdown.complete"}
+    assert client.client.is_closed
+
+
+def test_disconnect_cancels_the_request_handler():
+    cancelled = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await receive()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    received = []
+    middleware = CancelOnDisconnectMiddleware(app, paths=["/slow/"])
+    scope = {"type": "http", "path": "/slow/"}
+
+    asyncio.run(asyncio.wait_for(middleware(scope, receive, send), timeout=1))
+    assert cancelled.is_set()
+
+
+@pytest.mark.django_db
+def test_import_openfda_dump_is_batched_and_resumable(tmp_path):
+    events = [
+        {
+            "patient": {
+                "reaction": [{"reactionmeddrapt": f"REACTION {i}"}],
+                "drug": [
+                    {
+                        "medicinalproduct": name,
+                        "openfda": {"brand_name": [f"{name} BRAND"], "route": ["ORAL"]},
+                    }
+                ],
+            }
+        }
+        for i, name in enumerate(["ASPIRIN", "IBUPROFEN", "ASPIRIN", "NAPROXEN"])
+    ]
+    dump = tmp_path / "drug-event-0001-of-0001.json.zip"
+    with zipfile.ZipFile(dump, "w") as archive:
+        archive.writestr(
+            "drug-event-0001-of-0001.json",
+            json.dumps({"meta": {"results": {"total": 4}}, "results": events}),
+        )
+    Medication.objects.create(name="ASPIRIN", route="TOPICAL")
+
+    OpenFDAImport.objects.create(
+        source=f"{dump.resolve()}:drug-event-0001-of-0001.json", events_imported=2
+    )
+    output = StringIO()
+    call_command("import_openfda_dump", str(dump), batch_size=1, stdout=output)
+
+    assert "Resuming" in output.getvalue()
+    assert "events/s" in output.getvalue()
+    assert sorted(Medication.objects.values_list("name", flat=True)) == [
+        "ASPIRIN",
+        "NAPROXEN",
+    ]
+    aspirin = Medication.objects.get(name="ASPIRIN")
+    assert (aspirin.route, aspirin.brand_name) == ("TOPICAL", "ASPIRIN BRAND")
+    assert not aspirin.enrichment_pending
+
+    call_command("import_openfda_dump", str(dump), stdout=StringIO())
+    assert Medication.objects.count() == 2
+
+    call_command("import_openfda_dump", str(dump), restart=True, stdout=StringIO())
+    assert Medication.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_import_openfda_dump_sums_reactions_over_batches(tmp_path, monkeypatch):
+    events = [
+        {
+            "patient": {
+                "reaction": [{"reactionmeddrapt": reaction}],
+                "drug": [{"medicinalproduct": "ASPIRIN"}],
+            }
+        }
+        for reaction in ["NAUSEA", "HEADACHE", "HEADACHE"]
+    ]
+    (tmp_path / "events.json").write_text(json.dumps({"results": events}))
+    monkeypatch.chdir(tmp_path)
+
+    call_command("import_openfda_dump", "events.json", batch_size=1, stdout=StringIO())
+
+    aspirin = Medication.objects.get(name="ASPIRIN")
+    assert aspirin.reaction_counts == [["HEADACHE", 2], ["NAUSEA", 1]]
+    assert aspirin.known_reactions == "HEADACHE, NAUSEA"
+
+    output = StringIO()
+    call_command("import_openfda_dump", str(tmp_path / "events.json"), stdout=output)
+    assert "already imported" in output.getvalue()
+
+    call_command("import_openfda_dump", "events.json", restart=True, stdout=StringIO())
+    aspirin.refresh_from_db()
+    assert aspirin.reaction_counts == [["HEADACHE", 2], ["NAUSEA", 1]]
+
+
+@pytest.mark.django_db
+def test_import_openfda_dump_does_not_recount_a_failed_batch(tmp_path):
+    events = [
+        {
+            "patient": {
+                "reaction": [{"reactionmeddrapt": reaction}],
+                "drug": [{"medicinalproduct": "ASPIRIN"}],
+            }
+        }
+        for reaction in ["NAUSEA", "HEADACHE", "HEADACHE"]
+    ]
+    dump = tmp_path / "events.json"
+    dump.write_text(json.dumps({"results": events}))
+    Command = import_openfda_dump.Command
+    upsert_batch = Command.upsert_batch
+    calls = []
+
+    def crash_on_the_second_batch(self, progress, batch):
+        calls.append(batch)
+        upserted = upsert_batch(self, progress, batch)
+        if len(calls) == 2:
+            raise RuntimeError("worker killed")
+        return upserted
+
+    with mock.patch.object(Command, "upsert_batch", crash_on_the_second_batch):
+        with pytest.raises(RuntimeError):
+            call_command("import_openfda_dump", str(dump), batch_size=1, stdout=StringIO())
+    assert OpenFDAImport.objects.get().events_imported == 1
+
+    call_command("import_openfda_dump", str(dump), batch_size=1, stdout=StringIO())
+
+    aspirin = Medication.objects.get(name="ASPIRIN")
+    assert aspirin.reaction_counts == [["HEADACHE", 2], ["NAUSEA", 1]]
+
+
+@pytest.mark.django_db
+def test_bulk_import_writes_records_in_batches(
+    api_client, doctor, patient, django_capture_on_commit_callbacks
+):
+    Medication.objects.create(name="aspirin")
+    lines = [
+        {
+            "patient_id": patient.id,
+            "description": f"Visit {i}",
+            "medications": ["aspirin", f"drug {i % 3}"],
+        }
+        for i in range(30)
+    ]
+    lines[5] = {"patient_id": 999999, "description": "Unknown patient"}
+    lines[7] = {"patient_id": patient.id}
+    body = "\n".join(json.dumps(line) for line in lines)
+    api_client.force_authenticate(doctor)
+
+    with mock.patch.object(tasks.enrich_medications, "delay") as delay:
+        with django_capture_on_commit_callbacks(execute=True), CaptureQueriesContext(
+            connection
+        ) as queries:
+            response = api_client.post(
+                "/api/v1/medical-records/bulk-import/",
+                body,
+                content_type="application/x-ndjson",
+            )
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data["created"] == 28
+    assert [error["index"] for error in data["errors"]] == [5, 7]
+    assert data["errors"][1]["errors"] == {"description": ["This field is required."]}
+    assert MedicalRecord.objects.filter(doctor=doctor).count() == 28
+    assert MedicalRecord.medications.through.objects.count() == 56
+    assert len(delay.call_args.args[0]) == 3
+    assert len(queries) <= 10
+
+
+@pytest.mark.django_db
+def test_import_medical_records_command_reads_json_arrays(tmp_path, doctor, patient):
+    path = tmp_path / "records.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"patient_id": patient.id, "description": f"Visit {i}"}
+                for i in range(5)
+            ]
+        )
+    )
+    out = StringIO()
+
+    call_command(
+        "import_medical_records",
+        str(path),
+        doctor=doctor.id,
+        batch_size=2,
+        no_enrich=True,
+        stdout=out,
+    )
+
+    assert "Imported 5 of 5 records" in out.getvalue()
+    assert MedicalRecord.objects.filter(patient=patient).count() == 5
+
+
+@pytest.mark.django_db
+def test_export_streams_patient_history(api_client, doctor, patient):
+    aspirin = Medication.objects.create(name="aspirin")
+    for i in range(3):
+        record = MedicalRecord.objects.create(
+            patient=patient, doctor=doctor, description=f"Visit {i}"
+        )
+        record.medications.add(aspirin)
+    api_client.force_authenticate(doctor)
+
+    response = api_client.get(f"/api/v1/medical-records/export/?patient={patient.id}")
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    csv_response = api_client.get("/api/v1/medical-records/export/?output=csv")
+    csv_lines = b"".join(csv_response.streaming_content).decode().splitlines()
+
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert [json.loads(line)["description"] for line in lines] == [
+        "Visit 0",
+        "Visit 1",
+        "Visit 2",
+    ]
+    assert json.loads(lines[0])["medications"] == ["aspirin"]
+    assert csv_lines[0].startswith("id,patient_id,patient,")
+    assert len(csv_lines) == 4
+    assert api_client.get("/api/v1/medical-records/export/?output=xml").status_code == 400
+
+
+@pytest.mark.django_db
+def test_unchanged_lists_are_answered_with_304(
+    api_client, doctor, patient, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        MedicalRecord.objects.create(patient=patient, doctor=doctor, description="A")
+    api_client.force_authenticate(patient)
+
+    first = api_client.get("/api/v1/medical-records/")
+    with CaptureQueriesContext(connection) as queries:
+        cached = api_client.get(
+            "/api/v1/medical-records/", HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+    with django_capture_on_commit_callbacks(execute=True):
+        MedicalRecord.objects.create(patient=patient, doctor=doctor, description="B")
+    changed = api_client.get(
+        "/api/v1/medical-records/", HTTP_IF_NONE_MATCH=first["ETag"]
+    )
+
+    assert first.status_code == 200
+    assert cached.status_code == 304
+    assert len(queries) == 0
+    assert changed.status_code == 200
+    assert len(changed.json()["results"]) == 2
+    assert changed["ETag"] != first["ETag"]
+    # A write within the same second must not be hidden behind a date check
+    assert not first.has_header("Last-Modified")
+    assert (
+        api_client.get(
+            "/api/v1/medical-records/", HTTP_IF_MODIFIED_SINCE=http_date()
+        ).status_code
+        == 200
+    )
+
+
+def test_conditional_get_mixin_requires_version_stamps():
+    with pytest.raises(ImproperlyConfigured):
+
+        class Unversioned(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+            queryset = MedicalRecord.objects.all()
+
+
+@pytest.mark.django_db
+def test_medication_names_resolve_through_the_normalized_key():
+    aspirin = Medication.objects.create(name="Aspirin")
+
+    medications, created_ids = resolve_medications(
+        ["aspirin ", "ASPIRIN", "Ibuprofen", " ibuprofen"]
+    )
+
+    assert [medication.id for medication in medications][0] == aspirin.id
+    assert [medication.name for medication in medications] == ["Aspirin", "Ibuprofen"]
+    assert created_ids == [medications[1].id]
+    assert Medication.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_created_ids_leave_out_rows_inserted_concurrently():
+    insert_missing = services._insert_missing
+
+    def insert_after_another_request(medications):
+        Medication.objects.create(name="Ibuprofen")
+        return insert_missing(medications)
+
+    with mock.patch.object(
+        services, "_insert_missing", side_effect=insert_after_another_request
+    ):
+        medications, created_ids = resolve_medications(["Aspirin", "Ibuprofen"])
+
+    assert [medication.name for medication in medications] == ["Aspirin", "Ibuprofen"]
+    assert created_ids == [medications[0].id]
+    inserted = Medication.objects.filter(name="Aspirin", reaction_counts__isnull=True)
+    assert inserted.get().enrichment_pending
+
+
+@pytest.mark.django_db
+def test_renaming_a_medication_updates_its_normalized_name():
+    medication = Medication.objects.create(name="Aspirin")
+
+    medication.name = "Acetylsalicylic  Acid"
+    medication.save(update_fields=["name"])
+    renamed = Medication.objects.get(id=medication.id)
+    assert renamed.normalized_name == "acetylsalicylic acid"
+
+    renamed.name = "ASA"
+    renamed.save()
+    assert Medication.objects.get(id=medication.id).normalized_name == "asa"
+
+    renamed.route = "ORAL"
+    renamed.save(update_fields=["route"])
+    assert Medication.objects.get(id=medication.id).normalized_name == "asa"
+
+
+@pytest.mark.django_db
+def test_merge_duplicate_medications_rewrites_record_links(doctor, patient):
+    canonical = Medication.objects.create(name="Aspirin")
+    duplicates = [
+        Medication.objects.create(name=name, normalized_name=f"legacy {i}")
+        for i, name in enumerate(["aspirin ", "ASPIRIN", "Ibuprofen"])
+    ]
+    Medication.objects.filter(id__in=[m.id for m in duplicates]).update(
+        normalized_name=None
+    )
+    Medication.objects.filter(id=duplicates[1].id).update(
+        brand_name="BAYER", enrichment_pending=False
+    )
+    first = MedicalRecord.objects.create(patient=patient, doctor=doctor, description="A")
+    first.medications.add(canonical, duplicates[0])
+    second = MedicalRecord.objects.create(patient=patient, doctor=doctor, description="B")
+    second.medications.add(duplicates[1], duplicates[2])
+
+    result = tasks.merge_duplicate_medications(batch_size=10)
+
+    assert result == "Merged 2 of 3 duplicate medications."
+    assert sorted(Medication.objects.values_list("normalized_name", flat=True)) == [
+        "aspirin",
+        "ibuprofen",
+    ]
+    assert list(first.medications.values_list("id", flat=True)) == [canonical.id]
+    assert sorted(second.medications.values_list("name", flat=True)) == [
+        "Aspirin",
+        "Ibuprofen",
+    ]
+    canonical.refresh_from_db()
+    assert canonical.brand_name == "BAYER"
+    assert not canonical.enrichment_pending
+
+
+@pytest.mark.django_db
+def test_merge_duplicate_medications_merges_into_a_concurrent_insert():
+    duplicate = Medication.objects.create(name="Aspirin ", normalized_name="legacy")
+    Medication.objects.filter(id=duplicate.id).update(normalized_name=None)
+    inserted = Medication.objects.create(name="Aspirin")
+    select_for_update = Medication.objects.select_for_update
+    calls = []
+
+    def read_before_another_request_inserts(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            return Medication.objects.none()
+        return select_for_update(*args, **kwargs)
+
+    with mock.patch.object(
+        Medication.objects,
+        "select_for_update",
+        side_effect=read_before_another_request_inserts,
+    ):
+        result = tasks.merge_duplicate_medications(batch_size=10)
+
+    assert result == "Merged 1 of 1 duplicate medications."
+    assert list(Medication.objects.values_list("id", "normalized_name")) == [
+        (inserted.id, "aspirin")
+    ]
@@ -1,80 +1,568 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
 import requests
+from django.conf import settings
 from django.core.cache import cache
 
+from medical_records.cache import CacheStats, LocalCache
+from medical_records.models import MedicationPayload
+from medical_records.openfda import CircuitOpenError, get_async_client, get_client
+
+logger = logging.getLogger(__name__)
+
+local_cache = LocalCache(
+    max_size=settings.OPENFDA_LOCAL_CACHE_SIZE, ttl=settings.OPENFDA_LOCAL_CACHE_TTL
+)
+cache_stats = CacheStats("local", "shared")
+
+
+def normalize_query(query):
+    return " ".join(query.split()).lower()
+
+
+def openfda_cache_key(query):
+    """Shared cache key of a normalized query.
+
+    Versioned so entries written in an older format are never read back.
+    """
+    return f"openfda:v2:{query.replace(' ', '+')}"
+
 
 def fetch_medication_data(query):
+    """Look up a drug on openFDA through a two-tier cache.
+
+    Results are served from a per-process LRU first, then from the shared
+    Django cache. Entries past their fresh period are still served while a
+    single background refresh replaces them.
+
+    Lookups without results and upstream errors are cached too, for much
+    shorter periods, so unknown names and outages do not hit openFDA on every
+    call.
+
+    Concurrent misses for the same normalized query are coalesced: one caller
+    takes a short lock in the shared cache and fetches, while the others wait
+    for its result. The lock lives in Redis, so this holds across gunicorn and
+    Celery worker processes.
+    """
     if not query:
         return None, 400, "Query parameter is required"
 
-    cache_key = f"openfda_{query}"
-    data = cache.get(cache_key)
+    query = normalize_query(query)
+    cache_key = openfda_cache_key(query)
+    lock_key = _lock_key(cache_key)
+
+    deadline = time.monotonic() + settings.OPENFDA_LOCK_WAIT
+    while True:
+        entry = _get_cached_entry(cache_key)
+        if entry:
+            result, stale = _cached_result(entry)
+            if stale:
+                _refresh_in_background(query, cache_key)
+            return result
+
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, timeout=settings.OPENFDA_LOCK_TIMEOUT):
+            try:
+                # The previous holder may have stored its result just before
+                # releasing the lock we now hold.
+                if cache.get(cache_key) is not None:
+                    continue
+                return _fetch_and_cache(query, cache_key)
+            finally:
+                _release_lock(lock_key, token)
+
+        if time.monotonic() >= deadline:
+            # The current holder is taking too long; stop waiting on it.
+            return _fetch_and_cache(query, cache_key)
+
+        time.sleep(settings.OPENFDA_LOCK_POLL_INTERVAL)
+
+
+def _get_cached_entry(cache_key):
+    entry = _local_entry(cache_key)
+    if entry is None:
+        entry = _remember_shared_entry(cache_key, cache.get(cache_key))
+    return entry
+
+
+# Cache entry handling shared by the sync and async paths, which differ only
+# in how they talk to the shared cache and to openFDA.
+
+
+def _lock_key(cache_key):
+    return f"{cache_key}:lock"
+
+
+def _local_entry(cache_key):
+    entry = local_cache.get(cache_key)
+    if entry is None:
+        cache_stats.miss("local")
+    else:
+        cache_stats.hit("local")
+    return entry
+
+
+def _remember_shared_entry(cache_key, entry):
+    """Count a shared-tier read and keep a hit in the local tier"""
+    if entry is None:
+        cache_stats.miss("shared")
+        return None
+    cache_stats.hit("shared")
+    local_cache.set(cache_key, entry, ttl=_stale_seconds_left(entry))
+    return entry
+
+
+def _stale_seconds_left(entry):
+    stale_ttl = 0 if "status" in entry else settings.OPENFDA_CACHE_STALE_TTL
+    return max(entry["fresh_until"] + stale_ttl - time.time(), 0)
+
+
+def _cached_result(entry):
+    """Return the lookup result a cache entry stands for, and whether it is stale"""
+    if "status" in entry:
+        return (None, entry["status"], entry["message"]), False
+    stale = entry["fresh_until"] <= time.time()
+    return (entry["data"], 200, "Data retrieved from cache"), stale
+
+
+def _refreshed_meanwhile(cache_key, shared_entry):
+    """Whether another worker already refreshed the entry in the shared cache.
+
+    A stale copy can outlive a refresh in this process's local tier; checked
+    under the lock, this keeps it from starting a second upstream call.
+    """
+    if (
+        shared_entry is None
+        or "status" in shared_entry
+        or shared_entry["fresh_until"] <= time.time()
+    ):
+        return False
+    local_cache.set(cache_key, shared_entry, ttl=_stale_seconds_left(shared_entry))
+    return True
+
+
+def _negative_entry(status_code, message, timeout):
+    return {
+        "status": status_code,
+        "message": message,
+        "fresh_until": time.time() + timeout,
+    }
+
+
+def _fetched_outcome(raw_data, extracted_info):
+    """Return ``(entry, timeout, result)`` for a completed upstream fetch"""
+    if not raw_data.get("results"):
+        message = "No results found for this medication"
+        timeout = settings.OPENFDA_NEGATIVE_CACHE_TTL
+        return _negative_entry(404, message, timeout), timeout, (None, 404, message)
+
+    processed_data = {"raw_data": raw_data, "extracted_info": extracted_info}
+    entry = {
+        "data": processed_data,
+        "fresh_until": time.time() + settings.OPENFDA_CACHE_TTL,
+    }
+    timeout = settings.OPENFDA_CACHE_TTL + settings.OPENFDA_CACHE_STALE_TTL
+    return entry, timeout, (processed_data, 200, "Data retrieved from external API")
+
+
+def _failed_outcome(error):
+    """Return ``(entry, timeout, result)`` for a failed fetch; entry is None if not cached"""
+    if isinstance(error, CircuitOpenError):
+        return None, 0, (None, 503, str(error))
+    response = getattr(error, "response", None)
+    if response is not None and response.status_code == 404:
+        return _fetched_outcome({}, {})
+    message = f"Error fetching data from external API: {str(error)}"
+    timeout = settings.OPENFDA_ERROR_CACHE_TTL
+    return _negative_entry(500, message, timeout), timeout, (None, 500, message)
+
+
+def _should_store(entry, cache_failures):
+    # Background refreshes keep serving the stale entry rather than replace it
+    # with an error or an empty result.
+    return entry is not None and (cache_failures or "status" not in entry)
+
+
+def _release_lock(lock_key, token):
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def _refresh_in_background(query, cache_key):
+    """Start one refresh of a stale entry unless another worker already is"""
+    lock_key = _lock_key(cache_key)
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, timeout=settings.OPENFDA_LOCK_TIMEOUT):
+        return None
+    if _refreshed_meanwhile(cache_key, cache.get(cache_key)):
+        _release_lock(lock_key, token)
+        return None
+
+    def refresh():
+        try:
+            _fetch_and_cache(query, cache_key, cache_failures=False)
+        finally:
+            _release_lock(lock_key, token)
+
+    thread = threading.Thread(target=refresh, name=f"refresh-{cache_key}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _more_pages(first, page_size):
+    """Return the page numbers worth requesting after ``first``.
+
+    None when the first page came back short; otherwise up to
+    ``OPENFDA_PAGES``, bounded by the total openFDA reports.
+    """
+    if len(first.get("results", [])) < page_size:
+        return range(0)
+    pages = settings.OPENFDA_PAGES
+    total = first.get("meta", {}).get("results", {}).get("total")
+    if isinstance(total, int):
+        pages = min(pages, -(-total // page_size))
+    return range(1, pages)
+
+
+def _first_page_sample(first):
+    return {**first, "results": first.get("results", [])[: settings.OPENFDA_RAW_SAMPLE_SIZE]}
 
-    if data:
-        return data, 200, "Data retrieved from cache"
 
-    url = f"https://api.fda.gov/drug/event.json?search=patient.drug.medicinalproduct:{query}&limit=5"
+def _skip_failed_page(query, page, error):
+    # openFDA answers 404 once skip goes past the last match; any other
+    # failure only loses this page, and the lookup keeps the ones that arrived.
+    response = getattr(error, "response", None)
+    if response is None or response.status_code != 404:
+        logger.warning("openFDA page %s of %r failed: %s", page, query, error)
+    return {}
 
+
+def fetch_drug_events(query):
+    """Fetch up to ``OPENFDA_PAGES`` pages of events and fold them.
+
+    The first page is fetched alone, and further pages are requested only
+    when it comes back full, in parallel on at most ``OPENFDA_PAGE_WORKERS``
+    threads. Errors on the first page propagate; a failing later page is
+    logged and left out. Each page is folded into the counts as soon as it
+    arrives and then discarded; only a small sample of the first page is
+    kept as the raw payload.
+    """
+    client = get_client()
+    page_size = settings.OPENFDA_PAGE_SIZE
+
+    first = client.drug_events(query, limit=page_size)
+    folder = MedicationInfoFolder()
+    folder.add(first.get("results", []))
+    pages = _more_pages(first, page_size)
+    if not pages:
+        return _first_page_sample(first), folder.extracted()
+
+    def fetch_page(page):
+        try:
+            return client.drug_events(query, limit=page_size, skip=page * page_size)
+        except (requests.RequestException, CircuitOpenError) as e:
+            return _skip_failed_page(query, page, e)
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(pages), settings.OPENFDA_PAGE_WORKERS)
+    ) as executor:
+        futures = [executor.submit(fetch_page, page) for page in pages]
+        try:
+            for future in as_completed(futures):
+                folder.add(future.result().get("results", []))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return _first_page_sample(first), folder.extracted()
+
+
+def _fetch_and_cache(query, cache_key, cache_failures=True):
+    """Fetch a query from openFDA and store the outcome in both cache tiers.
+
+    With ``cache_failures`` off (background refreshes), errors and empty
+    results are not stored so the stale entry keeps being served.
+    """
+    try:
+        entry, timeout, result = _fetched_outcome(*fetch_drug_events(query))
+    except (CircuitOpenError, requests.RequestException) as e:
+        entry, timeout, result = _failed_outcome(e)
+
+    if _should_store(entry, cache_failures):
+        cache.set(cache_key, entry, timeout=timeout)
+        local_cache.set(cache_key, entry, ttl=timeout)
+    return result
+
+
+# Lookups in flight on each event loop, keyed by cache key
+_inflight = weakref.WeakKeyDictionary()
+# Strong references to background refresh tasks until they finish
+_background_tasks = set()
+
+
+async def afetch_medication_data(query):
+    """Async variant of ``fetch_medication_data`` for views served over ASGI.
+
+    Uses the same cache entries and lock keys as the sync path. Concurrent
+    misses on one event loop share a single task; waiting callers are
+    shielded from it, so a client that disconnects stops waiting without
+    aborting the lookup other callers (and the cache) still need.
+    """
+    if not query:
+        return None, 400, "Query parameter is required"
+
+    query = normalize_query(query)
+    cache_key = openfda_cache_key(query)
+
+    result = await _aget_cached_result(query, cache_key)
+    if result is not None:
+        return result
+
+    inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+    task = inflight.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(_alookup(query, cache_key))
+        inflight[cache_key] = task
+        task.add_done_callback(lambda _: inflight.pop(cache_key, None))
+    return await asyncio.shield(task)
+
+
+async def _aget_cached_result(query, cache_key):
+    entry = _local_entry(cache_key)
+    if entry is None:
+        entry = _remember_shared_entry(cache_key, await cache.aget(cache_key))
+    if entry is None:
+        return None
+
+    result, stale = _cached_result(entry)
+    if stale:
+        await _arefresh_in_background(query, cache_key)
+    return result
+
+
+async def _alookup(query, cache_key):
+    lock_key = _lock_key(cache_key)
+    deadline = time.monotonic() + settings.OPENFDA_LOCK_WAIT
+    while True:
+        token = uuid.uuid4().hex
+        if await cache.aadd(lock_key, token, timeout=settings.OPENFDA_LOCK_TIMEOUT):
+            try:
+                result = await _aget_cached_result(query, cache_key)
+                if result is not None:
+                    return result
+                return await _afetch_and_cache(query, cache_key)
+            finally:
+                await _arelease_lock(lock_key, token)
+
+        if time.monotonic() >= deadline:
+            return await _afetch_and_cache(query, cache_key)
+
+        await asyncio.sleep(settings.OPENFDA_LOCK_POLL_INTERVAL)
+        result = await _aget_cached_result(query, cache_key)
+        if result is not None:
+            return result
+
+
+async def _arelease_lock(lock_key, token):
+    if await cache.aget(lock_key) == token:
+        await cache.adelete(lock_key)
+
+
+async def _arefresh_in_background(query, cache_key):
+    lock_key = _lock_key(cache_key)
+    token = uuid.uuid4().hex
+    if not await cache.aadd(lock_key, token, timeout=settings.OPENFDA_LOCK_TIMEOUT):
+        return None
+    if _refreshed_meanwhile(cache_key, await cache.aget(cache_key)):
+        await _arelease_lock(lock_key, token)
+        return None
+
+    async def refresh():
+        try:
+            await _afetch_and_cache(query, cache_key, cache_failures=False)
+        finally:
+            await _arelease_lock(lock_key, token)
+
+    task = asyncio.ensure_future(refresh())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def afetch_drug_events(query):
+    """Async ``fetch_drug_events``: later pages are awaited together on the loop,
+    at most ``OPENFDA_PAGE_WORKERS`` of them in flight at a time"""
+    client = get_async_client()
+    page_size = settings.OPENFDA_PAGE_SIZE
+
+    first = await client.drug_events(query, limit=page_size)
+    in_flight = asyncio.Semaphore(settings.OPENFDA_PAGE_WORKERS)
+
+    async def fetch_page(page):
+        try:
+            async with in_flight:
+                return await client.drug_events(
+                    query, limit=page_size, skip=page * page_size
+                )
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            return _skip_failed_page(query, page, e)
+
+    pages = await asyncio.gather(
+        *(fetch_page(page) for page in _more_pages(first, page_size))
+    )
+    folder = MedicationInfoFolder()
+    for data in (first, *pages):
+        folder.add(data.get("results", []))
+    return _first_page_sample(first), folder.extracted()
+
+
+async def _afetch_and_cache(query, cache_key, cache_failures=True):
+    """Async ``_fetch_and_cache``, with the same outcomes and cache entries"""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        entry, timeout, result = _fetched_outcome(*await afetch_drug_events(query))
+    except (CircuitOpenError, httpx.HTTPError) as e:
+        entry, timeout, result = _failed_outcome(e)
 
-        processed_data = {
-            "raw_data": data,
-            "extracted_info": extract_medication_info(data),
+    if _should_store(entry, cache_failures):
+        await cache.aset(cache_key, entry, timeout=timeout)
+        local_cache.set(cache_key, entry, ttl=timeout)
+    return result
+
+
+class MedicationInfoFolder:
+    """Fold openFDA adverse events into per-field value counts in one pass.
+
+    Events can be added page by page and dropped right after, so memory grows
+    with the number of distinct values rather than with the payload size.
+    """
+
+    OPENFDA_FIELDS = (
+        ("brand_names", "brand_name"),
+        ("generic_names", "generic_name"),
+        ("manufacturers", "manufacturer_name"),
+        ("routes", "route"),
+        ("substance_names", "substance_name"),
+        ("pharm_classes", "pharm_class_epc"),
+    )
+
+    def __init__(self):
+        self.counts = {
+            key: Counter()
+            for key in (
+                "brand_names",
+                "generic_names",
+                "manufacturers",
+                "dosage_forms",
+                "routes",
+                "substance_names",
+                "pharm_classes",
+                "reactions",
+            )
         }
 
-        cache.set(cache_key, processed_data, timeout=60 * 60)
-        return processed_data, 200, "Data retrieved from external API"
-    except requests.RequestException as e:
-        return None, 500, f"Error fetching data from external API: {str(e)}"
+    def add(self, results):
+        for result in results:
+            patient = result.get("patient", {})
 
+            for reaction in patient.get("reaction", []):
+                if "reactionmeddrapt" in reaction:
+                    self.counts["reactions"][reaction["reactionmeddrapt"]] += 1
 
-def extract_medication_info(data):
-    """Extract important information from FDA API response"""
-    extracted = {
-        "brand_names": set(),
-        "generic_names": set(),
-        "manufacturers": set(),
-        "dosage_forms": set(),
-        "routes": set(),
-        "substance_names": set(),
-        "pharm_classes": set(),
-        "reactions": set(),
-    }
+            for drug in patient.get("drug", []):
+                if "drugdosageform" in drug:
+                    self.counts["dosage_forms"][drug["drugdosageform"]] += 1
+
+                openfda = drug.get("openfda", {})
+                for key, openfda_field in self.OPENFDA_FIELDS:
+                    self.counts[key].update(openfda.get(openfda_field, []))
 
-    if "results" not in data:
+    def extracted(self):
+        """Return each field's values, most frequent first, plus top reaction counts"""
+        extracted = {
+            key: [value for value, _ in counter.most_common()]
+            for key, counter in self.counts.items()
+        }
+        extracted["reaction_counts"] = [
+            [reaction, count]
+            for reaction, count in self.counts["reactions"].most_common(
+                settings.OPENFDA_TOP_REACTIONS
+            )
+        ]
         return extracted
 
-    for result in data.get("results", []):
-        patient = result.get("patient", {})
 
-        for reaction in patient.get("reaction", []):
-            if "reactionmeddrapt" in reaction:
-                extracted["reactions"].add(reaction["reactionmeddrapt"])
+def extract_medication_info(data):
+    """Extract important information from FDA API response"""
+    folder = MedicationInfoFolder()
+    folder.add(data.get("results", []))
+    return folder.extracted()
+
 
-        for drug in patient.get("drug", []):
-            if "dosageform" in drug:
-                extracted["dosage_forms"].add(drug["drugdosageform"])
+ENRICHED_FIELDS = (
+    "brand_name",
+    "generic_name",
+    "manufacturer",
+    "dosage_form",
+    "route",
+    "substance_name",
+    "pharm_class",
+    "known_reactions",
+    "reaction_counts",
+)
 
-            openfda = drug.get("openfda", {})
 
-            for brand in openfda.get("brand_name", []):
-                extracted["brand_names"].add(brand)
+def apply_medication_data(medication, data):
+    """Copy a processed openFDA payload onto a Medication instance (without saving).
 
-            for generic in openfda.get("generic_name", []):
-                extracted["generic_names"].add(generic)
+    The raw response is not copied; store it with ``save_medication_payloads``.
+    """
+    extracted = data.get("extracted_info", {})
 
-            for manufacturer in openfda.get("manufacturer_name", []):
-                extracted["manufacturers"].add(manufacturer)
+    medication.brand_name = next(iter(extracted.get("brand_names", [])), "") or None
+    medication.generic_name = (
+        next(iter(extracted.get("generic_names", [])), "") or None
+    )
+    medication.manufacturer = (
+        next(iter(extracted.get("manufacturers", [])), "") or None
+    )
+    medication.dosage_form = next(iter(extracted.get("dosage_forms", [])), "") or None
+    medication.route = next(iter(extracted.get("routes", [])), "") or None
+    medication.substance_name = (
+        next(iter(extracted.get("substance_names", [])), "") or None
+    )
+    medication.pharm_class = next(iter(extracted.get("pharm_classes", [])), "") or None
 
-            for route in openfda.get("route", []):
-                extracted["routes"].add(route)
+    reaction_counts = extracted.get("reaction_counts") or [
+        [reaction, None]
+        for reaction in extracted.get("reactions", [])[: settings.OPENFDA_TOP_REACTIONS]
+    ]
+    medication.known_reactions = (
+        ", ".join(reaction for reaction, _ in reaction_counts) or None
+    )
+    medication.reaction_counts = reaction_counts or None
 
-            for substance in openfda.get("substance_name", []):
-                extracted["substance_names"].add(substance)
+    return medication
 
-            for pharm_class in openfda.get("pharm_class_epc", []):
-                extracted["pharm_classes"].add(pharm_class)
 
-    return {k: list(v) for k, v in extracted.items()}
+def save_medication_payloads(raw_data_by_id):
+    """Insert or replace the raw openFDA payloads of several medications at once"""
+    payloads = [
+        MedicationPayload(medication_id=medication_id, data=raw_data)
+        for medication_id, raw_data in raw_data_by_id.items()
+        if raw_data is not None
+    ]
+    MedicationPayload.objects.bulk_create(
+        payloads,
+        update_conflicts=True,
+        unique_fields=["medication"],
+        update_fields=["data", "updated_at"],
+    )
@@ -9,8 +9,23 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "src.settings")
 
-application = get_asgi_application()
+# What get_asgi_application() does, with our handler in place of Django's
+django.setup(set_prefix=False)
+
+from medical_records.openfda import aclose_async_client  # noqa: E402
+from src.asgi_middleware import (  # noqa: E402
+    AsyncURLConfHandler,
+    CancelOnDisconnectMiddleware,
+    LifespanMiddleware,
+)
+
+django_application = AsyncURLConfHandler("src.asgi_urls")
+
+application = LifespanMiddleware(
+    CancelOnDisconnectMiddleware(django_application),
+    on_shutdown=[aclose_async_client],
+)
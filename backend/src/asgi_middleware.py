@@ -0,0 +1,90 @@
+import asyncio
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+
+class AsyncURLConfHandler(ASGIHandler):
+    """Django's ASGI handler, resolving every request against ``urlconf``.
+
+    Lets the ASGI worker route some paths to async views while WSGI workers
+    keep ``ROOT_URLCONF`` and its sync views.
+    """
+
+    def __init__(self, urlconf):
+        super().__init__()
+        self.urlconf = urlconf
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = self.urlconf
+        return request, error_response
+
+
+class LifespanMiddleware:
+    """Answer the ASGI lifespan protocol, which Django 4.2 does not speak.
+
+    Startup is acknowledged right away; on shutdown the ``on_shutdown``
+    coroutine functions run on the server's event loop, so resources bound to
+    that loop (such as the async openFDA client) are closed cleanly.
+    """
+
+    def __init__(self, app, on_shutdown=()):
+        self.app = app
+        self.on_shutdown = list(on_shutdown)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for callback in self.on_shutdown:
+                    await callback()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+class CancelOnDisconnectMiddleware:
+    """Cancel the request handler when the client goes away.
+
+    Django 4.2 keeps running a view after its client disconnects. For paths in
+    ``ASGI_CANCEL_ON_DISCONNECT_PATHS`` this middleware keeps listening on the
+    ASGI ``receive`` channel while the handler runs and cancels it on
+    ``http.disconnect``, so abandoned requests stop waiting on upstream calls.
+    Other paths are passed through untouched.
+    """
+
+    def __init__(self, app, paths=None):
+        self.app = app
+        self.paths = tuple(
+            settings.ASGI_CANCEL_ON_DISCONNECT_PATHS if paths is None else paths
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            return await self.app(scope, receive, send)
+
+        messages = asyncio.Queue()
+        handler = asyncio.ensure_future(self.app(scope, messages.get, send))
+
+        async def listen():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    handler.cancel()
+                    return
+
+        listener = asyncio.ensure_future(listen())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not listener.done():
+                raise
+        finally:
+            listener.cancel()
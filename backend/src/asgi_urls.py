@@ -0,0 +1,18 @@
+"""URL configuration of the ASGI worker.
+
+Routes external search to its async view and everything else as ``src.urls``
+does. Only ``src.asgi`` selects it, so WSGI workers keep the sync views.
+"""
+
+from django.urls import include, path
+
+from medical_records.api.v1.views import external_search
+
+urlpatterns = [
+    path(
+        "api/v1/medical-records/external-search/",
+        external_search,
+        name="external-search-async",
+    ),
+    path("", include("src.urls")),
+]
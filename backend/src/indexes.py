@@ -0,0 +1,19 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models
+
+
+class PostgresGinIndex(GinIndex):
+    """``GinIndex`` that falls back to a plain index on other database backends.
+
+    Local and test settings may run on SQLite, which has neither GIN nor the
+    PostgreSQL operator classes. Schema editors run index SQL unconditionally,
+    so instead of being left out like ``PostgresExclusionConstraint`` the
+    index covers the same columns with the default index type there.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != "postgresql":
+            return models.Index(fields=self.fields, name=self.name).create_sql(
+                model, schema_editor, **kwargs
+            )
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
@@ -0,0 +1,107 @@
+import json
+
+WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    """Incremental JSON tokenizer over a text stream read in fixed-size chunks"""
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} but found {char!r}")
+        self.pos += 1
+        return char
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number ending exactly at the buffer edge may continue in the
+            # next chunk, so only trust it once more input has been read.
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_array(reader):
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.decode()
+        if reader.expect(",]") == "]":
+            return
+
+
+def iter_json_array(fp, key=None, chunk_size=1 << 20):
+    """Yield the items of a JSON array from a text stream without loading it whole.
+
+    With ``key`` the document must be an object, and the items of its
+    top-level ``key`` array are yielded (other top-level values are parsed and
+    discarded). Memory use is bounded by the chunk size and the largest item.
+    """
+    reader = _Reader(fp, chunk_size)
+    if key is None:
+        yield from _iter_array(reader)
+        return
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        name = reader.decode()
+        reader.expect(":")
+        if name == key:
+            yield from _iter_array(reader)
+            return
+        reader.decode()
+        if reader.expect(",}") == "}":
+            return
+
+
+def iter_ndjson(fp):
+    """Yield the values of a newline-delimited JSON stream, skipping blank lines"""
+    for line_number, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number}: {e}") from None
@@ -0,0 +1,98 @@
+import hashlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import quote_etag
+
+from src.serializers import optimize_queryset
+from src.versioning import get_versions
+
+
+class SparseFieldsetsViewMixin:
+    """Push the fields a request asks for down into the read queryset.
+
+    Works with serializers using ``SparseFieldsetsMixin``: on read actions the
+    filtered queryset is narrowed with ``optimize_queryset`` so unrequested
+    columns and relations are not loaded. The paginator's ordering columns
+    are always kept, since it reads them from the last row for the cursor.
+    """
+
+    sparse_fieldsets_actions = ("list", "retrieve")
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in self.sparse_fieldsets_actions:
+            ordering = getattr(self.paginator, "ordering", ()) if self.action == "list" else ()
+            queryset = optimize_queryset(
+                queryset,
+                self.get_serializer(),
+                extra_fields=[field.lstrip("-") for field in ordering],
+            )
+        return queryset
+
+
+class ConditionalGetMixin:
+    """Answer ``304 Not Modified`` on list/retrieve from version stamps alone.
+
+    Subclasses must define ``get_version_stamps``, returning the
+    ``(scope, key)`` stamps their response depends on, or nothing to skip
+    conditional handling. The ETag hashes those stamps with the user, path and
+    negotiated media type, so a matching ``If-None-Match`` is answered from
+    one cache read, before the queryset runs. Writes bump the stamps (see
+    ``src.versioning.bump_versions``).
+
+    No Last-Modified is sent: at one-second resolution it could not tell apart
+    two writes in the same second, and the ETag already covers revalidation.
+    """
+
+    conditional_actions = ("list", "retrieve")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not callable(getattr(cls, "get_version_stamps", None)):
+            raise ImproperlyConfigured(
+                f"{cls.__name__} uses ConditionalGetMixin but does not define "
+                "get_version_stamps()."
+            )
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        stamps = (
+            self.get_version_stamps() if self.action in self.conditional_actions else None
+        )
+        if not stamps:
+            return handler(request, *args, **kwargs)
+
+        versions = get_versions(*stamps)
+        validator = ":".join(
+            map(
+                str,
+                [
+                    *versions,
+                    request.user.pk,
+                    request.get_full_path(),
+                    request.accepted_media_type,
+                ],
+            )
+        )
+        etag = quote_etag(hashlib.md5(validator.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response["ETag"] = etag
+
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Authorization",))
+        return response
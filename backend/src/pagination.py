@@ -0,0 +1,157 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(values, reverse=False):
+    payload = {"v": [_serialize(value) for value in values]}
+    if reverse:
+        payload["r"] = True
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    """Return ``(values, reverse)`` for an encoded cursor, raising NotFound if invalid"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values = payload["v"]
+        reverse = bool(payload.get("r", False))
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise NotFound("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise NotFound("Invalid cursor.")
+    return values, reverse
+
+
+def _serialize(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """Build the filter selecting rows strictly after ``values`` in ``ordering``.
+
+    The condition is written as ``a <= x AND (a < x OR (b <= y AND ...))`` rather
+    than a flat OR, so the leading column gives the database an index range to
+    start from and deep pages cost the same as the first one.
+    """
+    field = ordering[0]
+    descending = field.startswith("-")
+    name = field.lstrip("-")
+    if descending != reverse:
+        strict, inclusive = f"{name}__lt", f"{name}__lte"
+    else:
+        strict, inclusive = f"{name}__gt", f"{name}__gte"
+
+    if len(ordering) == 1:
+        return Q(**{strict: values[0]})
+    return Q(**{inclusive: values[0]}) & (
+        Q(**{strict: values[0]}) | keyset_filter(ordering[1:], values[1:], reverse)
+    )
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith("-") else f"-{field}" for field in ordering)
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a unique, composite ordering such as ``(created_at, id)``.
+
+    The cursor stores the ordering values of the first or last row of a page,
+    and the next page is selected with a keyset condition instead of an
+    OFFSET. Subclasses set ``ordering``; its last field must be unique.
+    """
+
+    ordering = ("-id",)
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        values, reverse = (None, False)
+        if encoded:
+            values, reverse = decode_cursor(encoded, len(self.ordering))
+
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, values, reverse))
+
+        try:
+            rows = list(queryset[: page_size + 1])
+        except (DjangoValidationError, ValueError, TypeError):
+            raise NotFound("Invalid cursor.")
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        page_size = settings.API_PAGE_SIZE
+        requested = request.query_params.get(self.page_size_query_param)
+        if requested:
+            try:
+                page_size = int(requested)
+            except ValueError:
+                pass
+        return max(1, min(page_size, settings.API_MAX_PAGE_SIZE))
+
+    def get_position(self, row):
+        return [getattr(row, field.lstrip("-")) for field in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = encode_cursor(self.get_position(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        cursor = encode_cursor(self.get_position(self.page[0]), reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,21 @@
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from src.jsonstream import iter_ndjson
+
+
+class NDJSONParser(BaseParser):
+    """Parse newline-delimited JSON into a list, one item per line"""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        try:
+            return list(iter_ndjson(codecs.getreader(encoding)(stream)))
+        except ValueError as e:
+            raise ParseError(f"NDJSON parse error - {e}")
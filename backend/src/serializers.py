@@ -0,0 +1,152 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def get_list_param(request, name):
+    """Parse a comma separated query parameter into a set of names"""
+    if request is None:
+        return set()
+    value = request.query_params.get(name, "")
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+class SparseFieldsetsMixin:
+    """Serializer mixin implementing the ``?fields=`` and ``?expand=`` parameters.
+
+    ``?fields=a,b`` keeps only the listed fields. ``?expand=x`` replaces the
+    compact representation of ``x`` with the serializer declared for it in
+    ``Meta.expandable_fields``, a mapping of field name to
+    ``(serializer_class, kwargs)``. Only the serializer built with the request
+    in its context is affected, not the ones nested inside it, and only on
+    safe methods: writes always validate and return the full field set.
+
+    ``Meta.field_sources`` lists the model lookups needed by fields that
+    ``optimize_queryset`` cannot resolve on its own, such as method fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        expand = get_list_param(request, "expand")
+        expandable = getattr(self.Meta, "expandable_fields", {})
+        for name, (serializer_class, options) in expandable.items():
+            if name in expand:
+                self.fields[name] = serializer_class(**options)
+
+        fields = get_list_param(request, "fields")
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class _Unresolved(Exception):
+    pass
+
+
+def optimize_queryset(queryset, serializer, extra_fields=()):
+    """Restrict ``queryset`` to the columns and relations ``serializer`` renders.
+
+    Concrete columns go into ``only()``, forward relations into
+    ``select_related()`` and to-many relations into a ``Prefetch`` restricted the
+    same way, so relations the serializer does not render are neither joined
+    nor fetched. If a field cannot be traced back to model columns, all columns
+    are loaded rather than risking a deferred-field query per row.
+    ``extra_fields`` names columns the caller reads itself, such as a
+    paginator's ordering, and are always kept in ``only()``.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    plan = _QueryPlan(queryset.model, set(queryset.query.annotations))
+    plan.collect(serializer)
+
+    if plan.complete:
+        queryset = queryset.only("pk", *plan.only, *extra_fields)
+    if plan.select:
+        queryset = queryset.select_related(*plan.select)
+    if plan.prefetch:
+        queryset = queryset.prefetch_related(*plan.prefetch.values())
+    return queryset
+
+
+class _QueryPlan:
+    def __init__(self, model, annotations):
+        self.model = model
+        self.annotations = annotations
+        self.only = set()
+        self.select = set()
+        self.prefetch = {}
+        self.complete = True
+
+    def collect(self, serializer, model=None, prefix=""):
+        model = model or self.model
+        sources = getattr(getattr(serializer, "Meta", None), "field_sources", {})
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            try:
+                if name in sources:
+                    for lookup in sources[name]:
+                        self.add_lookup(model, prefix, lookup.split("__"))
+                elif not prefix and field.source in self.annotations:
+                    continue
+                elif field.source == "*":
+                    raise _Unresolved(name)
+                elif isinstance(
+                    field, (serializers.ListSerializer, serializers.ManyRelatedField)
+                ):
+                    self.add_prefetch(model, prefix, field)
+                elif isinstance(field, serializers.BaseSerializer):
+                    lookup = prefix + "__".join(field.source_attrs)
+                    related_model = self.add_lookup(model, prefix, field.source_attrs)
+                    self.select.add(lookup)
+                    self.collect(field, related_model, lookup + "__")
+                else:
+                    self.add_lookup(model, prefix, field.source_attrs)
+            except (_Unresolved, FieldDoesNotExist):
+                self.complete = False
+
+    def add_lookup(self, model, prefix, parts):
+        """Record the columns and joins needed to read ``parts`` from ``model``"""
+        for index, part in enumerate(parts):
+            model_field = model._meta.get_field(part)
+            lookup = prefix + "__".join(parts[: index + 1])
+            if not model_field.concrete or model_field.many_to_many:
+                raise _Unresolved(lookup)
+
+            self.only.add(lookup)
+            if index == len(parts) - 1:
+                return model_field.related_model
+            if not model_field.is_relation:
+                raise _Unresolved(lookup)
+
+            self.select.add(lookup)
+            model = model_field.related_model
+        return model
+
+    def add_prefetch(self, model, prefix, field):
+        if len(field.source_attrs) != 1:
+            raise _Unresolved(field.source)
+
+        lookup = prefix + field.source
+        related_model = model._meta.get_field(field.source).related_model
+        child = (
+            field.child
+            if isinstance(field, serializers.ListSerializer)
+            else field.child_relation
+        )
+
+        related = related_model._default_manager.all()
+        if isinstance(child, serializers.BaseSerializer):
+            related = optimize_queryset(related, child)
+        elif isinstance(child, serializers.SlugRelatedField):
+            related = related.only(child.slug_field)
+        else:
+            related = related.only("pk")
+        self.prefetch[lookup] = Prefetch(lookup, queryset=related)
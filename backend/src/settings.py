@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "rest_framework",
     "drf_yasg",
@@ -121,6 +122,29 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
 }
 
+# Lifetime of the per-scope change stamps behind ETags
+VERSION_STAMP_TTL = int(os.environ.get("VERSION_STAMP_TTL", str(7 * 24 * 60 * 60)))
+
+# Rows fetched per round trip by streaming exports
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "2000"))
+
+# Bulk medical record import: rows per INSERT and items accepted per request
+MEDICAL_RECORD_IMPORT_BATCH_SIZE = int(
+    os.environ.get("MEDICAL_RECORD_IMPORT_BATCH_SIZE", "1000")
+)
+MEDICAL_RECORD_IMPORT_MAX_ITEMS = int(
+    os.environ.get("MEDICAL_RECORD_IMPORT_MAX_ITEMS", "10000")
+)
+
+# Requests on these paths are cancelled when the client disconnects (ASGI only)
+ASGI_CANCEL_ON_DISCONNECT_PATHS = [
+    "/api/v1/medical-records/external-search/",
+]
+
+# Default page size of paginated endpoints and hard cap for ?page_size=
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", "50"))
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", "200"))
+
 CORS_ALLOW_ALL_ORIGINS = os.environ.get("CORS_ALLOW_ALL_ORIGINS", "True") == "True"
 
 if not CORS_ALLOW_ALL_ORIGINS:
@@ -141,6 +165,89 @@ CACHES = {
 CELERY_BROKER_URL = f'redis://{os.environ.get("REDIS_HOST", "redis")}:{os.environ.get("REDIS_PORT", "6379")}/0'
 CELERY_RESULT_BACKEND = f'redis://{os.environ.get("REDIS_HOST", "redis")}:{os.environ.get("REDIS_PORT", "6379")}/0'
 
+# Expired appointment sweeper: rows per transaction and batches per run
+APPOINTMENT_SWEEP_BATCH_SIZE = int(os.environ.get("APPOINTMENT_SWEEP_BATCH_SIZE", "500"))
+APPOINTMENT_SWEEP_MAX_BATCHES = int(os.environ.get("APPOINTMENT_SWEEP_MAX_BATCHES", "200"))
+APPOINTMENT_SWEEP_INTERVAL = int(os.environ.get("APPOINTMENT_SWEEP_INTERVAL", "300"))
+
+# Appointment length and working hours (local time) used for availability
+APPOINTMENT_DURATION_MINUTES = int(os.environ.get("APPOINTMENT_DURATION_MINUTES", "30"))
+APPOINTMENT_WORKDAY_START = os.environ.get("APPOINTMENT_WORKDAY_START", "08:00")
+APPOINTMENT_WORKDAY_END = os.environ.get("APPOINTMENT_WORKDAY_END", "18:00")
+# Weekdays with appointments, Monday = 0
+APPOINTMENT_WORKDAYS = [
+    int(day) for day in os.environ.get("APPOINTMENT_WORKDAYS", "0,1,2,3,4").split(",")
+]
+AVAILABILITY_MAX_DAYS = int(os.environ.get("AVAILABILITY_MAX_DAYS", "31"))
+AVAILABILITY_MAX_DOCTORS = int(os.environ.get("AVAILABILITY_MAX_DOCTORS", "200"))
+AVAILABILITY_CACHE_TTL = int(os.environ.get("AVAILABILITY_CACHE_TTL", str(60 * 60)))
+# Most appointment IDs accepted by one bulk confirm/cancel request
+APPOINTMENT_BULK_MAX_IDS = int(os.environ.get("APPOINTMENT_BULK_MAX_IDS", "500"))
+
+# Periodic openFDA enrichment of medications still pending (new rows are
+# also enriched right after their record is saved)
+MEDICATION_ENRICH_BATCH_SIZE = int(os.environ.get("MEDICATION_ENRICH_BATCH_SIZE", "200"))
+MEDICATION_ENRICH_INTERVAL = int(os.environ.get("MEDICATION_ENRICH_INTERVAL", "600"))
+
+# Run with `celery -A src.celery beat`
+CELERY_BEAT_SCHEDULE = {
+    "cancel-expired-appointments": {
+        "task": "appointments.tasks.cancel_appointment",
+        "schedule": APPOINTMENT_SWEEP_INTERVAL,
+    },
+    "enrich-pending-medications": {
+        "task": "medical_records.tasks.enrich_medications",
+        "schedule": MEDICATION_ENRICH_INTERVAL,
+    },
+    "merge-duplicate-medications": {
+        "task": "medical_records.tasks.merge_duplicate_medications",
+        "schedule": 60 * 60,
+    },
+}
+
+# openFDA integration
+OPENFDA_BASE_URL = os.environ.get("OPENFDA_BASE_URL", "https://api.fda.gov")
+OPENFDA_CONNECT_TIMEOUT = float(os.environ.get("OPENFDA_CONNECT_TIMEOUT", "3.05"))
+OPENFDA_READ_TIMEOUT = float(os.environ.get("OPENFDA_READ_TIMEOUT", "10"))
+OPENFDA_MAX_RETRIES = int(os.environ.get("OPENFDA_MAX_RETRIES", "3"))
+OPENFDA_BACKOFF_FACTOR = float(os.environ.get("OPENFDA_BACKOFF_FACTOR", "0.3"))
+OPENFDA_BACKOFF_JITTER = float(os.environ.get("OPENFDA_BACKOFF_JITTER", "0.3"))
+OPENFDA_MAX_WORKERS = int(os.environ.get("OPENFDA_MAX_WORKERS", "8"))
+# Each lookup fetches OPENFDA_PAGES pages of OPENFDA_PAGE_SIZE events, at most
+# OPENFDA_PAGE_WORKERS at a time, and keeps the OPENFDA_TOP_REACTIONS most
+# frequent reactions plus OPENFDA_RAW_SAMPLE_SIZE raw events
+OPENFDA_PAGE_SIZE = int(os.environ.get("OPENFDA_PAGE_SIZE", "100"))
+OPENFDA_PAGES = int(os.environ.get("OPENFDA_PAGES", "5"))
+OPENFDA_PAGE_WORKERS = int(os.environ.get("OPENFDA_PAGE_WORKERS", "5"))
+OPENFDA_TOP_REACTIONS = int(os.environ.get("OPENFDA_TOP_REACTIONS", "20"))
+OPENFDA_RAW_SAMPLE_SIZE = int(os.environ.get("OPENFDA_RAW_SAMPLE_SIZE", "5"))
+OPENFDA_POOL_SIZE = int(
+    os.environ.get("OPENFDA_POOL_SIZE", str(OPENFDA_MAX_WORKERS * OPENFDA_PAGE_WORKERS))
+)
+# Connections shared by all async lookups of one ASGI worker
+OPENFDA_ASYNC_POOL_SIZE = int(os.environ.get("OPENFDA_ASYNC_POOL_SIZE", "100"))
+# Results stay fresh for OPENFDA_CACHE_TTL and are then served stale for up to
+# OPENFDA_CACHE_STALE_TTL while a background refresh runs
+OPENFDA_CACHE_TTL = int(os.environ.get("OPENFDA_CACHE_TTL", str(60 * 60)))
+OPENFDA_CACHE_STALE_TTL = int(os.environ.get("OPENFDA_CACHE_STALE_TTL", str(24 * 60 * 60)))
+OPENFDA_LOCAL_CACHE_SIZE = int(os.environ.get("OPENFDA_LOCAL_CACHE_SIZE", "512"))
+OPENFDA_LOCAL_CACHE_TTL = int(os.environ.get("OPENFDA_LOCAL_CACHE_TTL", "60"))
+# Lookups without results and upstream errors are cached for shorter periods
+OPENFDA_NEGATIVE_CACHE_TTL = int(os.environ.get("OPENFDA_NEGATIVE_CACHE_TTL", "600"))
+OPENFDA_ERROR_CACHE_TTL = int(os.environ.get("OPENFDA_ERROR_CACHE_TTL", "30"))
+# Circuit breaker shared by all workers through the cache
+OPENFDA_BREAKER_WINDOW = int(os.environ.get("OPENFDA_BREAKER_WINDOW", "60"))
+OPENFDA_BREAKER_MIN_CALLS = int(os.environ.get("OPENFDA_BREAKER_MIN_CALLS", "10"))
+OPENFDA_BREAKER_FAILURE_RATE = float(os.environ.get("OPENFDA_BREAKER_FAILURE_RATE", "0.5"))
+OPENFDA_BREAKER_OPEN_SECONDS = int(os.environ.get("OPENFDA_BREAKER_OPEN_SECONDS", "30"))
+# Local catalog search falls back to openFDA below this many matches
+MEDICATION_SEARCH_MIN_RESULTS = int(os.environ.get("MEDICATION_SEARCH_MIN_RESULTS", "3"))
+MEDICATION_SEARCH_MAX_RESULTS = int(os.environ.get("MEDICATION_SEARCH_MAX_RESULTS", "20"))
+# Single-flight lock held while one caller fetches a query for everyone else
+OPENFDA_LOCK_TIMEOUT = int(os.environ.get("OPENFDA_LOCK_TIMEOUT", "30"))
+OPENFDA_LOCK_WAIT = float(os.environ.get("OPENFDA_LOCK_WAIT", "15"))
+OPENFDA_LOCK_POLL_INTERVAL = float(os.environ.get("OPENFDA_LOCK_POLL_INTERVAL", "0.05"))
+
 SWAGGER_SETTINGS = {
     "USE_SESSION_AUTH": False,
     "SECURITY_DEFINITIONS": {
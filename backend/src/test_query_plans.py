@@ -0,0 +1,221 @@
+"""Query plan regression tests for the hot endpoint queries.
+
+A realistic volume of rows is seeded and analyzed once. Each test then
+requests a real endpoint (or runs the real task) and every query it sends to
+the table under test is run through ``EXPLAIN``: with the view's filters,
+annotations, sparse ``only()`` and keyset conditions on deep pages, it must be
+served by an index, never by a sequential scan.
+
+PostgreSQL only, and deselected by default because of the seeding; run with
+``pytest -m query_plans``.
+"""
+import datetime
+import random
+
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from appointments.api.v1.views import AppointmentPagination
+from appointments.models import Appointment
+from appointments.tasks import cancel_appointment
+from medical_records.api.v1.views import MedicalRecordPagination
+from medical_records.models import MedicalRecord
+from src.pagination import encode_cursor
+from users.models import User
+
+pytestmark = [
+    pytest.mark.query_plans,
+    pytest.mark.skipif(
+        connection.vendor != "postgresql", reason="query plans are PostgreSQL specific"
+    ),
+]
+
+APPOINTMENTS_TABLE = Appointment._meta.db_table
+MEDICAL_RECORDS_TABLE = MedicalRecord._meta.db_table
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+DOCTORS = 50
+PATIENTS = 5000
+APPOINTMENTS = 100_000
+MEDICAL_RECORDS = 100_000
+PAGE = 51
+# Settled appointments: 70% confirmed, 30% canceled
+SETTLED_STATUSES = [Appointment.Status.CONFIRMED] * 7 + [Appointment.Status.CANCELED] * 3
+
+
+@pytest.fixture(scope="module")
+def seeded(django_db_setup, django_db_blocker):
+    rng = random.Random(19)
+    now = timezone.now()
+
+    with django_db_blocker.unblock():
+        doctors = User.objects.bulk_create(
+            User(username=f"plan-doctor-{i}", password="!", is_doctor=True)
+            for i in range(DOCTORS)
+        )
+        patients = User.objects.bulk_create(
+            User(username=f"plan-patient-{i}", password="!") for i in range(PATIENTS)
+        )
+
+        appointments = []
+        duration = datetime.timedelta(minutes=30)
+        # Half-hour slots within a year either side of now, drawn without
+        # replacement per doctor so no two bookings overlap.
+        slots = {
+            doctor.id: iter(rng.sample(range(-17_520, 17_520), APPOINTMENTS // DOCTORS))
+            for doctor in doctors
+        }
+        for n in range(APPOINTMENTS):
+            doctor = doctors[n % DOCTORS]
+            date = now + next(slots[doctor.id]) * duration
+            # Nearly every past appointment was already confirmed or canceled.
+            settled = date < now and rng.random() < 0.98
+            appointments.append(
+                Appointment(
+                    patient=rng.choice(patients),
+                    doctor=doctor,
+                    date=date,
+                    ends_at=date + duration,
+                    status=(
+                        rng.choice(SETTLED_STATUSES)
+                        if settled
+                        else Appointment.Status.PENDING
+                    ),
+                )
+            )
+        Appointment.objects.bulk_create(appointments, batch_size=5000)
+
+        records = MedicalRecord.objects.bulk_create(
+            (
+                MedicalRecord(
+                    patient=rng.choice(patients),
+                    doctor=rng.choice(doctors),
+                    description="Routine visit",
+                )
+                for _ in range(MEDICAL_RECORDS)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE medical_records_medicalrecord SET created_at = "
+                "created_at - (random() * interval '730 days') WHERE id >= %s",
+                [records[0].id],
+            )
+            cursor.execute("ANALYZE")
+
+    yield {"doctor": doctors[0], "patient": patients[0], "now": now}
+
+    # The cascade fires the version stamp signals; keep them off Redis.
+    with django_db_blocker.unblock(), override_settings(CACHES=LOCMEM_CACHES):
+        User.objects.filter(username__startswith="plan-").delete()
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN {sql}")
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def table_plans(captured, table):
+    """EXPLAIN each captured query that reads ``table``"""
+    plans = [
+        explain(query["sql"])
+        for query in captured
+        if f'FROM "{table}"' in query["sql"]
+    ]
+    assert plans, f"no query read {table}"
+    return plans
+
+
+def assert_uses_index(plans):
+    for plan in plans:
+        assert "Seq Scan" not in plan, plan
+        assert "Index" in plan, plan
+
+
+def endpoint_plans(user, url, table):
+    client = APIClient()
+    client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200, response.content
+    return table_plans(queries.captured_queries, table)
+
+
+def deep_cursor(queryset, pagination_class, depth):
+    """Cursor of the row ``depth`` rows into a paginated list"""
+    paginator = pagination_class()
+    row = queryset.order_by(*paginator.ordering)[depth]
+    return encode_cursor(paginator.get_position(row))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "query",
+    ["", "&status=pending", "&deep", "&fields=id,date,doctor_name&deep"],
+)
+def test_doctor_appointments_use_an_index(seeded, query):
+    doctor = seeded["doctor"]
+    if "&deep" in query:
+        cursor = deep_cursor(
+            Appointment.objects.filter(doctor=doctor), AppointmentPagination, 1500
+        )
+        query = query.replace("&deep", f"&cursor={cursor}")
+
+    assert_uses_index(
+        endpoint_plans(
+            doctor, f"/api/v1/appointments/?page_size={PAGE}{query}", APPOINTMENTS_TABLE
+        )
+    )
+
+
+@pytest.mark.django_db
+def test_patient_appointments_use_an_index(seeded):
+    assert_uses_index(
+        endpoint_plans(
+            seeded["patient"],
+            f"/api/v1/appointments/?page_size={PAGE}",
+            APPOINTMENTS_TABLE,
+        )
+    )
+
+
+@pytest.mark.django_db
+def test_expired_appointment_sweep_uses_the_partial_index(seeded):
+    # The task's updates are rolled back with the test transaction.
+    with CaptureQueriesContext(connection) as queries:
+        cancel_appointment(batch_size=500, max_batches=1)
+
+    select_ids = table_plans(queries.captured_queries[:1], APPOINTMENTS_TABLE)
+    assert_uses_index(select_ids)
+    assert "appointment_pending_idx" in select_ids[0], select_ids[0]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["", "&fields=id,description"])
+def test_patient_medical_records_use_an_index(seeded, query):
+    patient = seeded["patient"]
+    assert_uses_index(
+        endpoint_plans(
+            patient,
+            f"/api/v1/medical-records/?user={patient.id}&page_size={PAGE}{query}",
+            MEDICAL_RECORDS_TABLE,
+        )
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("deep", [False, True])
+def test_all_medical_records_page_uses_an_index(seeded, deep):
+    url = f"/api/v1/medical-records/?page_size={PAGE}"
+    if deep:
+        cursor = deep_cursor(MedicalRecord.objects.all(), MedicalRecordPagination, 50_000)
+        url += f"&cursor={cursor}"
+
+    assert_uses_index(endpoint_plans(seeded["doctor"], url, MEDICAL_RECORDS_TABLE))
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(scope, key):
+    return f"version:{scope}:{key}"
+
+
+def get_versions(*stamps):
+    """Return the current stamp for each ``(scope, key)`` pair with one cache read.
+
+    Stamps are ``time.time_ns()`` values of the last change. A missing stamp
+    (never bumped, or evicted) is created as "changed now", which only ever
+    costs clients one extra full response.
+    """
+    keys = [version_key(scope, key) for scope, key in stamps]
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    for key, value in missing.items():
+        if not cache.add(key, value, timeout=settings.VERSION_STAMP_TTL):
+            value = cache.get(key, value)
+        found[key] = value
+    return [found[key] for key in keys]
+
+
+def bump_versions(scope, *keys):
+    """Mark ``scope`` as changed for each of ``keys`` (user IDs or ``"all"``).
+
+    The bump happens once the current transaction commits, so a reader can
+    never pair the new stamp with data from before the change.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+
+    def bump():
+        now = time.time_ns()
+        cache.set_many(
+            {version_key(scope, key): now for key in keys},
+            timeout=settings.VERSION_STAMP_TTL,
+        )
+
+    transaction.on_commit(bump)
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 
+from src.serializers import SparseFieldsetsMixin
 from users.models import User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username", "email", "is_doctor", "password"]
@@ -4,10 +4,14 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from src.pagination import KeysetPagination, encode_cursor
+from src.serializers import optimize_queryset
 from users.api.v1.serializers import UserSerializer
 from users.models import User
+from users.timeline import decode_position, patient_timeline
 
 
 class RegisterView(APIView):
@@ -35,8 +39,11 @@ class DoctorList(APIView):
         tags=["Users"],
     )
     def get(self, request):
-        doctors = User.objects.filter(is_doctor=True)
-        serializer = UserSerializer(doctors, many=True)
+        context = {"request": request}
+        doctors = optimize_queryset(
+            User.objects.filter(is_doctor=True), UserSerializer(context=context)
+        )
+        serializer = UserSerializer(doctors, many=True, context=context)
         return Response(serializer.data)
 
 
@@ -49,5 +56,61 @@ class ProfileView(APIView):
         tags=["Users"],
     )
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(request.user, context={"request": request})
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class PatientTimelineView(APIView):
+    permission_classes = (IsAuthenticated,)
+    cursor_query_param = "cursor"
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Get a patient's appointments and medical records merged into one "
+            "chronological, cursor-paginated stream. Doctors only see their own "
+            "appointments with the patient."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="Cursor returned in 'next'",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "page_size",
+                openapi.IN_QUERY,
+                description="Number of items per page",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ],
+        tags=["Users"],
+    )
+    def get(self, request, pk):
+        user = request.user
+        if user.id != pk and not user.is_doctor:
+            return Response(
+                {"detail": "You do not have permission to view this timeline."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        position = None
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            position = decode_position(encoded)
+
+        items, next_position = patient_timeline(
+            pk,
+            KeysetPagination().get_page_size(request),
+            position=position,
+            doctor=user if user.is_doctor and user.id != pk else None,
+        )
+
+        next_link = None
+        if next_position is not None:
+            next_link = replace_query_param(
+                request.build_absolute_uri(),
+                self.cursor_query_param,
+                encode_cursor(next_position),
+            )
+        return Response({"next": next_link, "results": items})
@@ -1,3 +1,77 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from appointments.models import Appointment
+from medical_records.models import MedicalRecord
+from src.pagination import encode_cursor
+
+
+@pytest.mark.django_db
+def test_doctor_list_honours_sparse_fieldsets(api_client, doctor, patient):
+    api_client.force_authenticate(patient)
+
+    response = api_client.get("/api/v1/doctors/?fields=id,username")
+
+    assert response.json() == [{"id": doctor.id, "username": "doctor"}]
+
+
+@pytest.mark.django_db
+def test_patient_timeline_merges_appointments_and_records(api_client, doctor, patient):
+    start = timezone.now()
+    for hours in (1, 4, 5):
+        Appointment.objects.create(
+            patient=patient, doctor=doctor, date=start + datetime.timedelta(hours=hours)
+        )
+    for hours in (2, 3, 5):
+        record = MedicalRecord.objects.create(
+            patient=patient, doctor=doctor, description=f"Visit {hours}"
+        )
+        MedicalRecord.objects.filter(id=record.id).update(
+            created_at=start + datetime.timedelta(hours=hours)
+        )
+    api_client.force_authenticate(patient)
+
+    items = []
+    url = f"/api/v1/patients/{patient.id}/timeline/?page_size=4"
+    while url:
+        with CaptureQueriesContext(connection) as queries:
+            page = api_client.get(url).json()
+        assert len(queries) <= 3
+        items += page["results"]
+        url = page["next"]
+
+    assert [item["type"] for item in items] == [
+        "appointment",
+        "medical_record",
+        "medical_record",
+        "appointment",
+        "appointment",
+        "medical_record",
+    ]
+    assert items[1]["description"] == "Visit 2"
+    assert [item["at"] for item in items] == sorted(item["at"] for item in items)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "values",
+    [
+        ["not a date", 0, 1],
+        ["2024-01-01T10:00:00", 0, 1],
+        ["2024-01-01T10:00:00+00:00", 2, 1],
+        ["2024-01-01T10:00:00+00:00", 0, "1"],
+        [{"at": 1}, 0, 1],
+    ],
+)
+def test_patient_timeline_rejects_malformed_cursors(api_client, patient, values):
+    api_client.force_authenticate(patient)
+
+    response = api_client.get(
+        f"/api/v1/patients/{patient.id}/timeline/?cursor={encode_cursor(values)}"
+    )
+
+    assert response.status_code == 404
@@ -0,0 +1,96 @@
+import heapq
+from itertools import islice
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+
+from appointments.models import Appointment
+from medical_records.models import MedicalRecord
+from src.pagination import decode_cursor, keyset_filter
+
+# Rank breaks ties between an appointment and a record at the same instant
+APPOINTMENT, MEDICAL_RECORD = 0, 1
+
+
+def decode_position(encoded):
+    """Return the ``(time, rank, id)`` position in a cursor, raising NotFound if invalid"""
+    values, _ = decode_cursor(encoded, 3)
+    at, rank, row_id = values
+    try:
+        at = parse_datetime(at) if isinstance(at, str) else None
+    except ValueError:
+        at = None
+    if (
+        at is None
+        or at.tzinfo is None
+        or type(rank) is not int
+        or rank not in (APPOINTMENT, MEDICAL_RECORD)
+        or type(row_id) is not int
+    ):
+        raise NotFound("Invalid cursor.")
+    return at, rank, row_id
+
+
+def _after(queryset, time_field, rank, position):
+    """Rows of one source that sort after ``position`` in the merged order"""
+    if position is None:
+        return queryset
+    at, after_rank, after_id = position
+    if rank > after_rank:
+        return queryset.filter(**{f"{time_field}__gte": at})
+    if rank < after_rank:
+        return queryset.filter(**{f"{time_field}__gt": at})
+    return queryset.filter(keyset_filter((time_field, "id"), (at, after_id)))
+
+
+def _appointments(patient_id, doctor, position, limit):
+    queryset = Appointment.objects.filter(patient_id=patient_id)
+    if doctor is not None:
+        queryset = queryset.filter(doctor=doctor)
+    queryset = _after(queryset, "date", APPOINTMENT, position).order_by("date", "id")
+    for row in queryset.values("id", "date", "doctor_id", "status")[:limit]:
+        yield (row["date"], APPOINTMENT, row["id"]), {
+            "type": "appointment",
+            "id": row["id"],
+            "at": row["date"],
+            "doctor_id": row["doctor_id"],
+            "status": Appointment.Status(row["status"]).label,
+        }
+
+
+def _medical_records(patient_id, position, limit):
+    queryset = MedicalRecord.objects.filter(patient_id=patient_id)
+    queryset = _after(queryset, "created_at", MEDICAL_RECORD, position).order_by(
+        "created_at", "id"
+    )
+    for row in queryset.values("id", "created_at", "doctor_id", "description")[
+        :limit
+    ]:
+        yield (row["created_at"], MEDICAL_RECORD, row["id"]), {
+            "type": "medical_record",
+            "id": row["id"],
+            "at": row["created_at"],
+            "doctor_id": row["doctor_id"],
+            "description": row["description"],
+        }
+
+
+def patient_timeline(patient_id, page_size, position=None, doctor=None):
+    """Return one page of a patient's appointments and records, oldest first.
+
+    Each source is read with a single keyset query on its ``(time, id)`` index,
+    limited to one page plus one row, and the two ordered streams are merged
+    lazily with ``heapq.merge``. ``position`` is the sort key of the last item
+    of the previous page; ``doctor`` restricts appointments to that doctor.
+
+    Returns ``(items, next_position)``; ``next_position`` is None on the last
+    page.
+    """
+    merged = heapq.merge(
+        _appointments(patient_id, doctor, position, page_size + 1),
+        _medical_records(patient_id, position, page_size + 1),
+        key=lambda entry: entry[0],
+    )
+    entries = list(islice(merged, page_size + 1))
+    next_position = entries[page_size - 1][0] if len(entries) > page_size else None
+    return [item for _, item in entries[:page_size]], next_position